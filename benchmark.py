@@ -0,0 +1,680 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Script to measure the performance of term_checker.py on synthetic data.
+
+To execute:
+    python3 benchmark.py
+
+To time each stage of a check on synthetic files of a given size, and
+record the results in a JSON file for comparison between versions:
+    python3 benchmark.py --stages --segments 1000 10000 --entries 1000
+        --alternatives 2 --multi-word 0.3 --inflection 0.2 --json results.json
+'''
+
+
+import argparse
+import contextlib
+import glob
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from xml.sax.saxutils import escape
+
+import term_checker
+from term_checker import Segment
+
+
+KANJI = '情報処理装置断面平面模式図技術分野発明概要特許請求範囲実施形態解決'
+KANA = 'のをはにがでするとしたもあるいう'
+SYLLABLES = ['ba', 'co', 'de', 'fi', 'gu', 'la', 'me', 'no', 'pa', 'ri',
+             'sa', 'to', 'vi', 'zo', 'ter', 'mon', 'ral', 'sen']
+FILLER = ['the', 'is', 'of', 'and', 'to', 'in', 'which', 'a', 'by', 'with',
+          'that', 'for', 'on', 'configured', 'provided', 'shown']
+
+TRANSLATION_FIXTURES = 'tests/*.tmx'
+GLOSSARY_FIXTURES = 'tests/*.txt'
+
+
+def make_terminology(entry_num, seed=0):
+    '''
+    Function to generate a grouped terminology dict with the given number of
+    source terms, each having a single target term.
+    '''
+    rng = random.Random(seed)
+    terminology = {}
+    while len(terminology) < entry_num:
+        source_term = ''.join(rng.choice(KANJI)
+                              for _ in range(rng.randint(2, 6)))
+        terminology[source_term] = ['term ' + str(len(terminology))]
+    return terminology
+
+
+def make_translation(segment_num, seed=0):
+    '''
+    Function to generate Segment objects containing random source text of a
+    typical patent sentence length (a generator, so that large translations
+    can be written out without being held in memory).
+    '''
+    rng = random.Random(seed)
+    for _ in range(segment_num):
+        source_text = ''.join(rng.choice(KANJI + 'のをはにがでする、')
+                              for _ in range(rng.randint(40, 120)))
+        yield Segment(source_text, 'target text')
+
+
+def make_word(rng):
+    '''
+    Function to generate a random English-like noun (some ending in "y", so
+    that their plural forms do not contain their singular forms).
+    '''
+    return (''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) +
+            rng.choice(['', '', 'y']))
+
+
+def make_glossary(entry_num, alternatives=1, multi_word=0.3, seed=0):
+    '''
+    Function to generate a grouped terminology dict with the given number of
+    source terms, each having 1 to alternatives target terms, a multi_word
+    proportion of which consist of 2 or 3 words.
+    '''
+    rng = random.Random(seed)
+    terminology = {}
+    while len(terminology) < entry_num:
+        # Drawn from the whole CJK block, so that source terms rarely occur
+        # by chance inside other source terms
+        source_term = ''.join(chr(rng.randint(0x4E00, 0x9FA5))
+                              for _ in range(rng.randint(2, 6)))
+        target_terms = []
+        for _ in range(rng.randint(1, alternatives)):
+            word_num = rng.randint(2, 3) if rng.random() < multi_word else 1
+            target_terms.append(' '.join(make_word(rng)
+                                         for _ in range(word_num)))
+        terminology[source_term] = target_terms
+    return terminology
+
+
+def write_glossary(terminology, glossary_file):
+    '''
+    Function to write a grouped terminology dict to a tab-delimited glossary
+    file, with one line per target term.
+    '''
+    with open(glossary_file, 'w', encoding='utf-8') as file:
+        for source_term, target_terms in terminology.items():
+            for target_term in target_terms:
+                file.write(source_term + '\t' + target_term + '\n')
+
+
+def make_bench_translation(terminology, segment_num, terms_per_segment=3,
+                           inflection=0.2, missing=0.05, seed=0):
+    '''
+    Function to generate Segment objects whose source text contains
+    terms_per_segment glossary source terms. Each term is translated in the
+    target text with one of its target terms, which is inflected (plural,
+    or hyphenated if it consists of several words) in an inflection
+    proportion of cases, and left out in a missing proportion of cases.
+    '''
+    rng = random.Random(seed)
+    source_terms = list(terminology)
+    for _ in range(segment_num):
+        source_parts = []
+        target_parts = []
+        for source_term in rng.sample(source_terms,
+                                      min(terms_per_segment,
+                                          len(source_terms))):
+            source_parts.append(source_term + ''.join(
+                rng.choice(KANA) for _ in range(rng.randint(5, 15))))
+            target_parts.extend(rng.choice(FILLER)
+                                for _ in range(rng.randint(3, 8)))
+            if rng.random() < missing:
+                continue
+            target_term = rng.choice(terminology[source_term])
+            if rng.random() < inflection:
+                if ' ' in target_term and rng.random() < 0.5:
+                    target_term = target_term.replace(' ', '-')
+                elif target_term.endswith('y'):
+                    target_term = target_term[:-1] + 'ies'
+                else:
+                    target_term += 's'
+            target_parts.append(target_term)
+        yield Segment(''.join(source_parts), ' '.join(target_parts) + '.')
+
+
+def write_tmx(translation, translation_file):
+    '''
+    Function to write a list (or generator) of Segment objects to a tmx file.
+    '''
+    with open(translation_file, 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   '<tmx version="1.4">\n<header srclang="ja-JP"/>\n<body>\n')
+        for segment in translation:
+            file.write('<tu><tuv xml:lang="ja-JP"><seg>{}</seg></tuv>'
+                       '<tuv xml:lang="en-US"><seg>{}</seg></tuv></tu>\n'
+                       .format(escape(segment.source_text),
+                               escape(segment.target_text)))
+        file.write('</body>\n</tmx>\n')
+
+
+def peak_memory(function, *args):
+    '''
+    Function to return the peak memory in MiB allocated while calling a
+    function (as traced by tracemalloc).
+    '''
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def naive_scan(terminology, translation):
+    '''
+    Function reproducing the original source term lookup in basic_check,
+    i.e. testing every glossary entry against every segment with "in".
+    '''
+    hits = 0
+    for segment in translation:
+        for entry in terminology:
+            if entry in segment.source_text:
+                hits += 1
+    return hits
+
+
+def scanner_scan(terminology, translation):
+    '''
+    Function performing the same lookup using a TermScanner (including the
+    time taken to build the automaton).
+    '''
+    hits = 0
+    scanner = term_checker.TermScanner(terminology)
+    for segment in translation:
+        hits += len(scanner.scan(segment.source_text))
+    return hits
+
+
+def timed(function, *args):
+    '''
+    Function to return the result of a function call and the time it took
+    in seconds.
+    '''
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_source_scan(segment_num=1000,
+                      entry_nums=(100, 1000, 10000, 40000)):
+    '''
+    Function to compare the naive and automaton-based source term lookups
+    as the glossary grows.
+    '''
+    translation = list(make_translation(segment_num))
+
+    print('\nSource term scan ({} segments)'.format(segment_num))
+    print('{:>10} {:>12} {:>12} {:>9}'.format('entries', 'naive (s)',
+                                              'scanner (s)', 'speedup'))
+
+    for entry_num in entry_nums:
+        terminology = make_terminology(entry_num)
+        naive_hits, naive_time = timed(naive_scan, terminology, translation)
+        scanner_hits, scanner_time = timed(scanner_scan, terminology,
+                                           translation)
+        assert naive_hits == scanner_hits
+        print('{:>10} {:>12.3f} {:>12.3f} {:>8.1f}x'.format(
+            entry_num, naive_time, scanner_time, naive_time / scanner_time))
+
+
+def stream_translation(translation_file):
+    '''
+    Function to read every segment of a tmx file without keeping them.
+    '''
+    for _ in term_checker.iter_translation(translation_file):
+        pass
+
+
+def bench_tmx_memory(segment_nums=(10000, 100000)):
+    '''
+    Function to compare the peak memory of reading a tmx file into a list
+    with get_translation and streaming it with iter_translation.
+    '''
+    print('\nTMX reading peak memory')
+    print('{:>10} {:>10} {:>16} {:>17}'.format('segments', 'size (MB)',
+                                              'list (MiB)', 'stream (MiB)'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        translation_file = os.path.join(directory, 'translation.tmx')
+        for segment_num in segment_nums:
+            write_tmx(make_translation(segment_num), translation_file)
+            size = os.path.getsize(translation_file) / 10 ** 6
+            listed = peak_memory(term_checker.get_translation,
+                                 translation_file)
+            streamed = peak_memory(stream_translation, translation_file)
+            print('{:>10} {:>10.1f} {:>16.1f} {:>17.1f}'.format(
+                segment_num, size, listed, streamed))
+
+
+def retain_all(terminology, translation_file):
+    '''
+    Function to run the checks that do not need NLP while keeping every
+    segment, as main did before findings-only retention.
+    '''
+    translation = list(term_checker.iter_translation(translation_file))
+    translation, _ = term_checker.basic_check(terminology, translation)
+    return term_checker.hyphen_check(terminology, translation)
+
+
+def retain_findings(terminology, translation_file):
+    '''
+    Function to run the checks that do not need NLP while keeping only the
+    segments with findings, as main does (finding repetitions, and keeping
+    only the earlier segments they may repeat which have findings).
+    '''
+    repeats = term_checker.Repeats()
+    translation = term_checker.iter_translation(translation_file)
+    translation = repeats.mark(translation)
+    translation = term_checker.stream_basic_check(terminology, translation)
+    translation = repeats.forget_clean(translation)
+    return [segment for segment in translation
+            if term_checker.needs_checking(segment)]
+
+
+def bench_segment_memory(segment_num=1000000, missing_num=5):
+    '''
+    Function to compare the peak memory of keeping every segment with that
+    of keeping only segments with findings, for a glossary in which only
+    missing_num of the source terms have target terms missing from the
+    translation.
+    '''
+    terminology = {source_term: ['target']
+                   for source_term in make_terminology(200)}
+    for source_term in list(terminology)[:missing_num]:
+        terminology[source_term] = ['absent']
+    glossary = term_checker.CompiledGlossary(terminology)
+
+    print('\nSegment retention peak memory ({} segments)'.format(segment_num))
+    print('{:>16} {:>10} {:>14}'.format('retention', 'kept', 'peak (MiB)'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        translation_file = os.path.join(directory, 'translation.tmx')
+        write_tmx(make_translation(segment_num), translation_file)
+        for name, function in [('all segments', retain_all),
+                               ('findings only', retain_findings)]:
+            tracemalloc.start()
+            kept = len(function(glossary, translation_file))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{:>16} {:>10} {:>14.1f}'.format(name, kept, peak / 2 ** 20))
+
+
+def fixture_texts():
+    '''
+    Function to return the target texts and glossary target terms found in
+    the test fixtures.
+    '''
+    texts = []
+    for translation_file in sorted(glob.glob(TRANSLATION_FIXTURES)):
+        for segment in term_checker.get_translation(translation_file):
+            if term_checker.contains_content(segment):
+                texts.append(segment.target_text)
+
+    terms = []
+    for glossary_file in sorted(glob.glob(GLOSSARY_FIXTURES)):
+        terminology = term_checker.get_terminology(glossary_file)
+        terminology = term_checker.clean_lines(terminology)
+        terminology = term_checker.format_check(terminology)
+        for target_terms in term_checker.group_terminology(
+                terminology).values():
+            terms.extend(target_terms)
+
+    return texts, terms
+
+
+def bench_pipelines(profiles=('full', 'lemma', 'lookup'), repeat=20):
+    '''
+    Function to compare the pipeline profiles of setup_tokenizer in terms of
+    load time, time per segment, and agreement of token lemmas (in the
+    fixture target texts) and term lemmas (of the fixture glossary terms)
+    with the full pipeline.
+    '''
+    texts, terms = fixture_texts()
+
+    print('\nPipeline profiles ({} segments, {} terms)'.format(len(texts),
+                                                           len(terms)))
+    print('{:>8} {:>10} {:>14} {:>15} {:>14}'.format(
+        'profile', 'load (s)', 'segment (ms)', 'token lemmas', 'term lemmas'))
+
+    reference = None
+    for profile in profiles:
+        try:
+            nlp, load_time = timed(term_checker.setup_tokenizer, profile)
+        except (OSError, ValueError) as error:
+            print('{:>8} unavailable ({})'.format(profile, error))
+            continue
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            docs = [nlp(text) for text in texts]
+        segment_time = ((time.perf_counter() - start) /
+                        max(len(texts) * repeat, 1))
+
+        token_lemmas = [token.lemma_ for doc in docs for token in doc]
+        term_lemmas = [term_checker.get_lemma(term, nlp) for term in terms]
+        if reference is None:
+            reference = (token_lemmas, term_lemmas)
+
+        print('{:>8} {:>10.3f} {:>14.3f} {:>15} {:>14}'.format(
+            profile, load_time, segment_time * 1000,
+            agreement(token_lemmas, reference[0]),
+            agreement(term_lemmas, reference[1])))
+
+
+def bench_checker(repeat=100):
+    '''
+    Function to measure the time taken by TermChecker.check_segment per
+    segment of the test fixtures, the first time each segment is checked
+    and when it is checked again.
+    '''
+    segments = [segment
+                for translation_file in sorted(glob.glob(TRANSLATION_FIXTURES))
+                for segment in term_checker.get_translation(translation_file)]
+    glossary_files = sorted(glob.glob(GLOSSARY_FIXTURES))
+    if not segments or not glossary_files:
+        return
+
+    print('\nTermChecker latency ({} segments)'.format(len(segments)))
+    print('{:>8} {:>14}'.format('cache', 'segment (ms)'))
+
+    glossary = term_checker.prepare_glossary(glossary_files[0])
+    checker = term_checker.TermChecker(glossary)
+    for name, times in [('cold', 1), ('warm', repeat)]:
+        start = time.perf_counter()
+        for _ in range(times):
+            for segment in segments:
+                checker.check_segment(segment.source_text,
+                                      segment.target_text)
+        segment_time = ((time.perf_counter() - start) /
+                        (len(segments) * times))
+        print('{:>8} {:>14.3f}'.format(name, segment_time * 1000))
+
+
+def bench_startup(repeat=5):
+    '''
+    Function to measure the time taken to start a new Python process and
+    import term_checker, to do the same and import spaCy, and to check a
+    translation in which the basic check finds nothing missing (so spaCy
+    is never imported), taking the median of several runs of each.
+    '''
+    directory = os.path.dirname(os.path.abspath(term_checker.__file__))
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        translation_file = os.path.join(temporary_directory, 'clean.tmx')
+        glossary_file = os.path.join(temporary_directory, 'glossary.txt')
+        terminology = make_glossary(100)
+        write_glossary(terminology, glossary_file)
+        write_tmx(make_bench_translation(terminology, 100, inflection=0,
+                                         missing=0),
+                  translation_file)
+
+        commands = [
+            ('import', ['-c', 'import term_checker']),
+            ('import + spaCy', ['-c', 'import term_checker, spacy']),
+            ('clean file check', ['term_checker.py', translation_file,
+                                  glossary_file])]
+
+        print('\nStartup time (median of {} runs)'.format(repeat))
+        for name, arguments in commands:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run([sys.executable] + arguments, cwd=directory,
+                               stdout=subprocess.DEVNULL, check=True)
+                times.append(time.perf_counter() - start)
+            print('{:>18} {:>10.3f} s'.format(name, statistics.median(times)))
+
+
+def bench_compiled_glossary(entry_nums=(1000, 10000, 100000)):
+    '''
+    Function to compare the time taken to read a glossary file with that
+    taken to load the same glossary compiled by --compile-glossary.
+    '''
+    print('\nGlossary loading time')
+    print('{:>10} {:>11} {:>12} {:>12}'.format('entries', 'compiled MB',
+                                               'text (s)', 'compiled (s)'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        glossary_file = os.path.join(directory, 'glossary.txt')
+        for entry_num in entry_nums:
+            write_glossary(make_glossary(entry_num, 2), glossary_file)
+            glossary, text_time = timed(term_checker.read_glossary,
+                                        glossary_file)
+            term_checker.write_compiled_glossary(glossary, glossary_file)
+            _, compiled_time = timed(term_checker.read_compiled_glossary,
+                                     glossary_file)
+            size = os.path.getsize(glossary_file + '.compiled') / 10 ** 6
+            print('{:>10} {:>11.1f} {:>12.3f} {:>12.3f}'.format(
+                entry_num, size, text_time, compiled_time))
+
+
+def bench_mapped_translation(segment_num=100000, worker_nums=(1, 2, 4)):
+    '''
+    Function to compare the time taken to read a translation and run the
+    basic check on it with iter_translation and with --mmap, using
+    different numbers of worker processes.
+    '''
+    terminology = make_glossary(1000, 2)
+    glossary = term_checker.CompiledGlossary(terminology)
+
+    print('\nReading and basic check ({} segments, {} CPUs)'.format(
+        segment_num, os.cpu_count()))
+    print('{:>14} {:>10}'.format('reader', 'time (s)'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        translation_file = os.path.join(directory, 'translation.tmx')
+        write_tmx(make_bench_translation(terminology, segment_num),
+                  translation_file)
+
+        _, streamed_time = timed(lambda: [
+            segment for segment in term_checker.stream_basic_check(
+                glossary, term_checker.iter_translation(translation_file))
+            if segment.missing_terms])
+        print('{:>14} {:>10.2f}'.format('iterparse', streamed_time))
+
+        for worker_num in worker_nums:
+            _, mapped_time = timed(list, term_checker.iter_mapped_checks(
+                translation_file, glossary, worker_num, False))
+            print('{:>14} {:>10.2f}'.format(
+                'mmap x{}'.format(worker_num), mapped_time))
+
+
+def read_terminology_in_steps(glossary_file):
+    '''
+    Function to read a glossary as was done before read_terminology, with
+    each step building a new list or dict of the whole glossary.
+    '''
+    terminology = term_checker.get_terminology(glossary_file)
+    terminology = term_checker.clean_lines(terminology)
+    terminology = term_checker.format_check(terminology)
+    terminology = term_checker.remove_duplicates(terminology)
+    return term_checker.group_terminology(terminology)
+
+
+def bench_glossary_memory(line_nums=(1000000, 3000000)):
+    '''
+    Function to compare the peak memory and time taken to read glossaries
+    of millions of lines (with two target terms per source term, and a
+    duplicate and a malformed line every 100 lines) step by step and with
+    read_terminology.
+    '''
+    print('\nGlossary reading peak memory')
+    print('{:>10} {:>10} {:>18} {:>10} {:>10}'.format('lines', 'file MB',
+                                                      'reader',
+                                                      'peak MiB', 'time (s)'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        glossary_file = os.path.join(directory, 'glossary.txt')
+        for line_num in line_nums:
+            with open(glossary_file, 'w') as f:
+                for index in range(line_num):
+                    if index % 100 == 98:
+                        f.write('*term{}\ttarget term {}\n'.format(
+                            (index - 1) // 2, index - 1))
+                    elif index % 100 == 99:
+                        f.write('malformed line {}\n'.format(index))
+                    else:
+                        f.write('*term{}\ttarget term {}\n'.format(
+                            index // 2, index))
+            size = os.path.getsize(glossary_file) / 10 ** 6
+
+            for name, function in [('steps', read_terminology_in_steps),
+                                   ('read_terminology',
+                                    term_checker.read_terminology)]:
+                # Timed separately, as tracing memory slows reading down
+                with contextlib.redirect_stdout(io.StringIO()):
+                    _, elapsed = timed(function, glossary_file)
+                    peak = peak_memory(function, glossary_file)
+                print('{:>10} {:>10.1f} {:>18} {:>10.1f} {:>10.2f}'.format(
+                    line_num, size, name, peak, elapsed))
+
+
+def agreement(lemmas, reference):
+    '''
+    Function to return the percentage of lemmas identical to those in the
+    reference list, formatted for display.
+    '''
+    if not reference or len(lemmas) != len(reference):
+        return 'n/a'
+    same = sum(x == y for x, y in zip(lemmas, reference))
+    return '{:.1f}%'.format(100 * same / len(reference))
+
+
+def bench_stages(segment_num, entry_num, alternatives=1, multi_word=0.3,
+                 inflection=0.2, profile='full'):
+    '''
+    Function to time each stage of checking a synthetic translation against
+    a synthetic glossary, returning a dict of the configuration, the time in
+    seconds taken by each stage, and the counts of the work done. The lemma
+    check is skipped if the spaCy model cannot be loaded.
+    '''
+    config = {'segments': segment_num, 'entries': entry_num,
+              'alternatives': alternatives, 'multi_word': multi_word,
+              'inflection': inflection, 'pipeline': profile}
+    stages = {}
+    term_checker.COUNTERS.clear()
+
+    def stage(name, function, *args):
+        result, stages[name] = timed(function, *args)
+        return result
+
+    with tempfile.TemporaryDirectory() as directory:
+        translation_file = os.path.join(directory, 'translation.tmx')
+        glossary_file = os.path.join(directory, 'glossary.txt')
+        terminology = make_glossary(entry_num, alternatives, multi_word)
+        write_glossary(terminology, glossary_file)
+        write_tmx(make_bench_translation(terminology, segment_num,
+                                         inflection=inflection),
+                  translation_file)
+
+        translation = stage('get_translation', term_checker.get_translation,
+                            translation_file)
+        stage('iter_translation', stream_translation, translation_file)
+        glossary = stage('prepare_glossary', term_checker.prepare_glossary,
+                         glossary_file)
+
+    translation, _ = stage('basic_check', term_checker.basic_check,
+                           glossary, translation)
+
+    # Variants of missing terms are found by the basic check itself, so they
+    # are timed on their own by looking for them again in copies of the
+    # segments with missing terms
+    stage('hyphen_check', term_checker.hyphen_check, glossary,
+          [term_checker.Segment(segment.source_text, segment.target_text,
+                                dict(segment.missing_terms))
+           for segment in translation if segment.missing_terms])
+
+    try:
+        nlp = stage('setup_tokenizer', term_checker.setup_tokenizer, profile)
+    except (OSError, ValueError) as error:
+        print('Lemma check skipped ({})'.format(error), file=sys.stderr)
+    else:
+        translation = stage('lemma_check', term_checker.lemma_check,
+                            nlp, glossary, translation)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        stage('output_results', term_checker.output_results, translation)
+
+    return {'config': config,
+            'stages': stages,
+            'counters': dict(term_checker.COUNTERS),
+            'segments_with_errors': sum(1 for segment in translation
+                                        if segment.findings())}
+
+
+def run_stages(args):
+    '''
+    Function to run bench_stages for every combination of the sizes given
+    on the command line, print the results, and write them to a JSON file if
+    requested.
+    '''
+    results = []
+    for segment_num, entry_num in itertools.product(args.segments,
+                                                    args.entries):
+        result = bench_stages(segment_num, entry_num, args.alternatives,
+                              args.multi_word, args.inflection, args.pipeline)
+        results.append(result)
+
+        print('\nStages ({} segments, {} entries)'.format(segment_num,
+                                                          entry_num))
+        for name, seconds in result['stages'].items():
+            print('{:>17} {:>10.3f} s'.format(name, seconds))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'python': platform.python_version(),
+                       'spacy': term_checker.spacy_version(),
+                       'results': results},
+                      file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--stages', action='store_true',
+                        help='time each stage on synthetic files')
+    parser.add_argument('--segments', type=int, nargs='+', default=[1000])
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000])
+    parser.add_argument('--alternatives', type=int, default=1,
+                        help='maximum number of target terms per entry')
+    parser.add_argument('--multi-word', type=float, default=0.3,
+                        help='proportion of multi-word target terms')
+    parser.add_argument('--inflection', type=float, default=0.2,
+                        help='proportion of target terms inflected')
+    parser.add_argument('--pipeline', default='full',
+                        choices=sorted(term_checker.PIPELINE_EXCLUDES))
+    parser.add_argument('--json', help='file to write the results to')
+    args = parser.parse_args()
+
+    if args.stages:
+        run_stages(args)
+    else:
+        bench_source_scan()
+        bench_tmx_memory()
+        bench_segment_memory()
+        bench_pipelines()
+        bench_checker()
+        bench_startup()
+        bench_compiled_glossary()
+        bench_mapped_translation()
+        bench_glossary_memory()
+
+
+if __name__ == "__main__":
+    main()
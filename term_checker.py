@@ -17,32 +17,446 @@ these are entered on separate lines rather than all on the same line, e.g.:
 
 To execute:
     python3 term_checker.py translation.tmx glossary.txt
+
+To check several translations in one run (see batch_main):
+    python3 term_checker.py --batch translations/ glossary.txt
+    python3 term_checker.py --manifest=manifest.txt
+
+To check a translation in shards, e.g. on several machines (see shard_main):
+    python3 term_checker.py --split=4 translation.tmx glossary.txt
+    python3 term_checker.py --shard=1 translation.tmx.shards.json
+    ...
+    python3 term_checker.py --merge translation.tmx.shards.json
+
+To compile a glossary once for faster loading (see compile_main):
+    python3 term_checker.py --compile-glossary glossary.txt
+
+To keep spaCy loaded between checks (see serve_main):
+    python3 term_checker.py --serve
+    python3 term_checker.py translation.tmx glossary.txt --daemon
 '''
 
 
+import codecs
+import csv
+import gc
+import glob
+import hashlib
+import io
+import itertools
+import json
+import marshal
+import mmap
+import os
+import re
+import sqlite3
 import sys
+import time
+import tracemalloc
+from array import array
+from collections import Counter, OrderedDict
+from types import MappingProxyType
+from xml.etree import ElementTree
+from xml.sax.saxutils import quoteattr
 
-import spacy
-from spacy.tokenizer import Tokenizer
-from spacy.util import compile_infix_regex
 from colorama import Fore
-from translate.storage.tmx import tmxfile
+
+# spaCy, NumPy, translate-toolkit and the modules used only by batch runs
+# and the daemon are imported in the functions that use them, so that a
+# translation in which the basic check finds nothing missing is checked
+# without the time taken to import them (spaCy alone takes about a second)
+
+
+# Counts of the work done during a run, e.g. the number of nlp() calls
+COUNTERS = Counter()
+
+# spaCy model (package) providing the NLP pipeline
+SPACY_MODEL = 'en_core_web_sm'
+
+# Components of en_core_web_sm left out when loading each pipeline profile.
+# Only .text and .lemma_ are read from the docs, so the parser and NER are
+# never needed. The rule-based lemmatizer relies on the part-of-speech tags
+# set by the tagger and attribute ruler, while the "lookup" profile replaces
+# it with a lookup table lemmatizer (requires spacy-lookups-data).
+PIPELINE_EXCLUDES = {'full': [],
+                     'lemma': ['parser', 'ner', 'senter'],
+                     'lookup': ['tok2vec', 'tagger', 'parser',
+                                'attribute_ruler', 'lemmatizer', 'ner',
+                                'senter']}
+
+
+def pipeline_profile(value):
+    '''
+    Function to convert the value of the --pipeline option.
+    '''
+    if value not in PIPELINE_EXCLUDES:
+        raise ValueError(value)
+    return value
+
+
+# Command line options accepted in the form --option=value, and the
+# functions used to convert their values
+OPTIONS = {'--workers': int,
+           '--batch-size': int,
+           '--lemma-cache': str,
+           '--pipeline': pipeline_profile,
+           '--find': str,
+           '--manifest': str,
+           '--port': int,
+           '--profile': str,
+           '--coverage': str,
+           '--jsonl': str,
+           '--csv': str,
+           '--split': int,
+           '--shard': int}
+
+# Command line options accepted without a value (--profile and --coverage
+# may be given either way)
+FLAGS = ['--index', '--incremental', '--batch', '--serve', '--daemon',
+         '--profile', '--coverage', '--merge', '--compile-glossary',
+         '--mmap']
+
+# Maximum number of target terms kept in a lemma cache
+LEMMA_CACHE_SIZE = 100000
+
+# Changed whenever the way lemma forms are obtained changes, so that lemma
+# caches written by earlier versions are discarded
+LEMMA_CACHE_VERSION = 1
+
+# Changed whenever the checks change, so that the results stored for
+# incremental runs by earlier versions are discarded
+FINGERPRINT_STORE_VERSION = 2
+
+# Line-break hyphenation (a hyphen or soft hyphen at the end of a line),
+# removed from target text by normalize_text
+LINE_BREAK_HYPHEN = re.compile(r'[-\u00ad][ \t]*\r?\n\s*')
+
+# Dashes treated as hyphens by normalize_text (hyphen, non-breaking hyphen,
+# figure dash, en dash), and soft hyphens, which are removed
+DASH_FORMS = str.maketrans({'\u2010': '-', '\u2011': '-', '\u2012': '-',
+                            '\u2013': '-', '\u00ad': None})
+
+
+# Read-only empty mapping shared by all segments with nothing to report
+NO_FINDINGS = MappingProxyType({})
+
+# NLP pipeline, glossaries and options shared by the jobs of a batch run,
+# set up once before the jobs start (see batch_main), or by the checks
+# requested from a daemon (see serve_main)
+BATCH = {}
+
+# Local port on which the daemon listens for check requests by default
+DAEMON_PORT = 8765
+
+# Command line options with which a translation is always checked in this
+# process, even with --daemon: the daemon neither reports what they ask for
+# nor checks translations in the way they select (it uses its own options)
+LOCAL_CHECK_OPTIONS = ['index', 'find', 'coverage', 'profile', 'incremental',
+                       'pipeline', 'mmap', 'workers', 'batch_size',
+                       'lemma_cache']
+
+# Number of segments whose results are kept by a TermChecker
+CHECKER_CACHE_SIZE = 10000
+
+# Number of characters of output held by a reporter before it is written
+REPORT_BUFFER_SIZE = 65536
+
+# Changed whenever the format of shard manifests changes
+SHARD_MANIFEST_VERSION = 1
+
+# Number of malformed glossary lines shown by read_terminology, beyond which
+# they are only counted
+MALFORMED_LINES_SHOWN = 10
+
+# Number of translation units in each of the ranges in which a memory-mapped
+# translation is parsed and checked (see iter_mapped_checks)
+TU_RANGE_SIZE = 10000
+
+# Start tag of a translation unit (but not of a tuv) in a tmx file
+TU_START = re.compile(rb'<tu[\s/>]')
+
+# Source language attribute of the header of a tmx file, and language
+# attribute of a tuv element
+HEADER_SRCLANG = re.compile(rb'<header\s[^>]*?\bsrclang\s*=\s*(["\'])(.*?)\1')
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+XML_LANG = '{' + XML_NAMESPACE + '}lang'
+
+# Start of every compiled glossary file (see write_compiled_glossary)
+COMPILED_GLOSSARY_MAGIC = b'TERMGLOS'
+
+# Changed whenever the content of compiled glossary files changes, so that
+# files written by earlier versions are ignored
+COMPILED_GLOSSARY_VERSION = 1
 
 
 class Segment():
     '''
     Used to create objects for each source-target segment extracted
-    from a tmx file.
+    from a tmx file. Segments are slotted, and those without missing terms
+    or hyphenated forms share NO_FINDINGS rather than holding empty dicts.
+    A segment identical to an earlier one has that segment as repeat_of, and
+    is given its results rather than being checked again. The position of
+    a segment is the number of translation units before it in its file.
+    The source terms found in the source text are kept as source_terms
+    once it has been scanned, with the fingerprint of the glossary scanned
+    for (see CompiledGlossary.source_terms).
     '''
+    __slots__ = ('source_text', 'target_text',
+                 'missing_terms', 'hyphenated_forms', 'repeat_of',
+                 'position', 'source_terms')
+
     def __init__(self,
                  source_text,  # string
                  target_text,  # string
-                 missing_terms,  # dict {string: list of strings}
-                 hyphenated_forms):  # dict {string: string}
+                 missing_terms=None,  # dict {string: list of strings}
+                 hyphenated_forms=None,  # dict {string: string}
+                 position=None):  # int
         self.source_text = source_text
         self.target_text = target_text
-        self.missing_terms = missing_terms
-        self.hyphenated_forms = hyphenated_forms
+        self.missing_terms = missing_terms or NO_FINDINGS
+        self.hyphenated_forms = hyphenated_forms or NO_FINDINGS
+        self.repeat_of = None
+        self.position = position
+        self.source_terms = None  # (fingerprint, list of strings)
+
+    def add_missing_term(self, source_term, target_terms):
+        '''
+        Function to record a source term whose target terms are missing.
+        '''
+        if self.missing_terms is NO_FINDINGS:
+            self.missing_terms = {}
+        self.missing_terms[source_term] = target_terms
+
+    def add_hyphenated_form(self, source_term, hyphenated_form):
+        '''
+        Function to record the hyphenated form of a missing term found in
+        the target text.
+        '''
+        if self.hyphenated_forms is NO_FINDINGS:
+            self.hyphenated_forms = {}
+        self.hyphenated_forms[source_term] = hyphenated_form
+
+    def findings(self):
+        '''
+        Function to return a list of Finding objects, one for each source
+        term still recorded as missing.
+        '''
+        return [Finding(source_term, target_terms,
+                        self.hyphenated_forms.get(source_term))
+                for source_term, target_terms in self.missing_terms.items()]
+
+    def repeat_key(self):
+        '''
+        Function to return the source and target text with runs of
+        whitespace normalized, identifying repetitions of this segment.
+        '''
+        return tuple(' '.join(text.split()) if text else text
+                     for text in (self.source_text, self.target_text))
+
+    def repeat_digest(self):
+        '''
+        Function to return a fixed-size hash of the repeat key, by which
+        repetitions are found without keeping the text of earlier segments.
+        '''
+        return hashlib.sha1(repr(self.repeat_key()).encode()).digest()
+
+
+# Stands in for the earlier segment repeated by a segment once the earlier
+# segment is known to have no missing terminology (see Repeats)
+CLEAN_SEGMENT = Segment(None, None)
+
+
+class Finding():
+    '''
+    Used to create objects for each missing term reported for a segment.
+    '''
+    __slots__ = ('source_term', 'target_terms', 'hyphenated_form')
+
+    def __init__(self,
+                 source_term,  # string
+                 target_terms,  # list of strings
+                 hyphenated_form=None):  # string
+        self.source_term = source_term
+        self.target_terms = target_terms
+        self.hyphenated_form = hyphenated_form
+
+    def __eq__(self, other):
+        '''
+        Function to compare findings by their source term, target terms and
+        hyphenated form.
+        '''
+        return (isinstance(other, Finding) and
+                (self.source_term, self.target_terms, self.hyphenated_form) ==
+                (other.source_term, other.target_terms, other.hyphenated_form))
+
+    def __repr__(self):
+        '''
+        Function to return a representation of a finding, for test output.
+        '''
+        return 'Finding({!r}, {!r}, {!r})'.format(
+            self.source_term, self.target_terms, self.hyphenated_form)
+
+    def as_dict(self):
+        '''
+        Function to return the finding as a dict, e.g. for JSON output.
+        '''
+        return {'source_term': self.source_term,
+                'target_terms': self.target_terms,
+                'hyphenated_form': self.hyphenated_form}
+
+
+class Profiler():
+    '''
+    Used to measure the wall time, CPU time and peak memory (as traced by
+    tracemalloc) of each stage of a run, when enabled with --profile.
+    A stage is either a function call or a generator, in which case its
+    time is that spent producing its items. Where stages are nested (e.g.
+    a generator consuming the items of another), the time spent in the
+    inner stage is not included in that of the outer one.
+    '''
+    def __init__(self):
+        self.enabled = False
+        # {name: {'wall': seconds, 'cpu': seconds, 'peak': bytes,
+        #         'calls': number, 'items': number}}
+        self.stages = {}
+        # [wall time, CPU time, peak memory] of the stages running, the
+        # times being those spent in stages nested within them
+        self.frames = []
+        self.start = None  # wall and CPU time when enabled
+
+    def enable(self):
+        '''
+        Function to start profiling.
+        '''
+        self.enabled = True
+        tracemalloc.start()
+        self.start = (time.perf_counter(), time.process_time())
+
+    def stage(self, name, iterable):
+        '''
+        Function to return an iterable whose items are produced as a stage,
+        or the iterable itself if profiling is not enabled.
+        '''
+        if not self.enabled:
+            return iterable
+        return self.measure_items(name, iterable)
+
+    def measure_items(self, name, iterable):
+        '''
+        Function to yield the items of an iterable, measuring the time taken
+        to produce each of them as a stage.
+        '''
+        iterator = iter(iterable)
+        while True:
+            try:
+                item = self.call(name, next, iterator)
+            except StopIteration:
+                return
+            self.stages[name]['items'] += 1
+            yield item
+
+    def call(self, name, function, *args):
+        '''
+        Function to call a function as a stage, returning its result.
+        '''
+        if not self.enabled:
+            return function(*args)
+
+        # Keep the peak memory of the stage this one is nested in
+        if self.frames:
+            self.frames[-1][2] = max(self.frames[-1][2],
+                                     tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+        frame = [0.0, 0.0, 0]
+        self.frames.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return function(*args)
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self.frames.pop()
+            peak = max(frame[2], tracemalloc.get_traced_memory()[1])
+
+            stats = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0,
+                                                  'peak': 0, 'calls': 0,
+                                                  'items': 0})
+            stats['wall'] += wall - frame[0]
+            stats['cpu'] += cpu - frame[1]
+            stats['peak'] = max(stats['peak'], peak)
+            stats['calls'] += 1
+
+            if self.frames:
+                parent = self.frames[-1]
+                parent[0] += wall
+                parent[1] += cpu
+                parent[2] = max(parent[2], peak)
+                tracemalloc.reset_peak()
+
+    def report(self):
+        '''
+        Function to return the measurements of each stage, the totals for
+        the run, and the counts of the work done, as a dict.
+        '''
+        wall = time.perf_counter() - self.start[0]
+        cpu = time.process_time() - self.start[1]
+        if 'read_mapped' in self.stages:
+            # Only the segments still to be checked are read with --mmap
+            segment_num = COUNTERS['mapped_segments']
+        else:
+            segment_num = self.stages.get('read_translation',
+                                          {}).get('items', 0)
+        counters = dict(COUNTERS)
+        counters['nlp_calls'] = (COUNTERS['target_parses'] +
+                                 COUNTERS['term_parses'])
+
+        return {'stages': {name: {'wall': stats['wall'],
+                                  'cpu': stats['cpu'],
+                                  'peak_mib': stats['peak'] / 2 ** 20,
+                                  'calls': stats['calls'],
+                                  'items': stats['items']}
+                           for name, stats in self.stages.items()},
+                'wall': wall,
+                'cpu': cpu,
+                'peak_mib': max([tracemalloc.get_traced_memory()[1]] +
+                                [stats['peak']
+                                 for stats in self.stages.values()]) / 2 ** 20,
+                'segments': segment_num,
+                'segments_per_second': segment_num / wall if wall else 0.0,
+                'counters': counters}
+
+
+# Profiler used for the stages of a run (disabled unless --profile is used)
+PROFILER = Profiler()
+
+
+def split_options(user_input):
+    '''
+    Function to separate command line options (e.g. --workers=4) from the
+    other arguments entered at the command line. Returns the remaining
+    arguments and a dict of options, e.g. {'workers': 4}, in which flags
+    (e.g. --index) have the value True. Anything that is not a known option
+    with a valid value is left with the arguments, so that it is reported
+    by user_input_check.
+    '''
+    arguments = []
+    options = {}
+
+    for argument in user_input:
+        if argument in FLAGS:
+            options[argument[2:].replace('-', '_')] = True
+            continue
+        name, _, value = argument.partition('=')
+        if name in OPTIONS and value:
+            try:
+                options[name[2:].replace('-', '_')] = OPTIONS[name](value)
+                continue
+            except ValueError:
+                pass
+        arguments.append(argument)
+
+    return arguments, options
 
 
 def user_input_check(user_input):
@@ -78,7 +492,40 @@ def user_input_check(user_input):
     if not input_verified:
         print('\nIncorrect input.\n'
               'Please try again using the following format.\n'
-              'python3 terminology_check.py translation.tmx glossary.txt\n')
+              'python3 terminology_check.py translation.tmx glossary.txt\n'
+              'Options:\n'
+              '  --workers=N         processes used for lemmatization\n'
+              '  --batch-size=N      segments lemmatized per batch\n'
+              '  --lemma-cache=PATH  lemma cache file ("off" to disable)\n'
+              '  --pipeline=PROFILE  full, lemma or lookup (default: full)\n'
+              '  --index             check using an index of the whole '
+              'translation\n'
+              '  --find=TERM         list the segments in which a term is '
+              'used\n'
+              '  --incremental       only re-check segments changed since the '
+              'last run\n'
+              '  --batch             check several translations (see '
+              'README)\n'
+              '  --manifest=FILE     check the translation/glossary pairs '
+              'listed in a file\n'
+              '  --serve             run as a daemon keeping spaCy loaded\n'
+              '  --daemon            check using the daemon if it is '
+              'running\n'
+              '  --port=N            port of the daemon (default: ' +
+              str(DAEMON_PORT) + ')\n'
+              '  --profile[=FILE]    report the time and memory taken by '
+              'each stage\n'
+              '  --coverage[=FILE]   report how often each term is used and '
+              'translated\n'
+              '  --jsonl=FILE        also write the results to a JSON Lines '
+              'file\n'
+              '  --csv=FILE          also write the results to a CSV file\n'
+              '  --split=N           split the translation into N shards '
+              '(see README)\n'
+              '  --compile-glossary  compile a glossary for faster loading '
+              '(see README)\n'
+              '  --mmap              read the translation with --workers '
+              'processes\n')
 
     return input_verified
 
@@ -87,6 +534,8 @@ def get_translation(translation_file):
     '''
     Function to extract translation from a user-specified tmx file.
     '''
+    from translate.storage.tmx import tmxfile
+
     try:
         with open(translation_file, 'rb') as file:
             tmx_file = tmxfile(file)
@@ -96,15 +545,245 @@ def get_translation(translation_file):
     else:
         translation = []  # List of Segment objects
 
-        for node in tmx_file.unit_iter():
+        for position, node in enumerate(tmx_file.unit_iter()):
             source_text = node.source
             target_text = node.target
-            segment = Segment(source_text, target_text, {}, {})
+            segment = Segment(source_text, target_text, position=position)
             translation.append(segment)
 
         return translation
 
 
+def iter_translation(translation_file):
+    '''
+    Function to extract translation from a user-specified tmx file one
+    segment at a time. The file is parsed incrementally and each translation
+    unit is discarded once its segment has been yielded, so memory use does
+    not grow with the size of the file. As with get_translation, the tuv
+    in the language given by the srclang attribute of the header is taken as
+    the source (see get_tu_texts).
+    '''
+    try:
+        file = open(translation_file, 'rb')
+    except FileNotFoundError as fnf_error:
+        print(fnf_error)
+        sys.exit()
+
+    with file:
+        parent = None  # element containing the tu elements (i.e. body)
+        srclang = None
+        position = 0
+
+        for event, element in ElementTree.iterparse(file,
+                                                    events=('start', 'end')):
+            if event == 'start':
+                if element.tag == 'body':
+                    parent = element
+                continue
+
+            if element.tag == 'header':
+                srclang = element.get('srclang')
+
+            elif element.tag == 'tu':
+                source_text, target_text = get_tu_texts(element, srclang)
+                yield Segment(source_text, target_text, position=position)
+                position += 1
+
+                # Discard the translation unit now it has been used
+                element.clear()
+                if parent is not None:
+                    parent.clear()
+
+
+def get_tu_texts(tu, srclang=None):
+    '''
+    Function to return the source and target text of a tu element (None for
+    any that is missing). The source is the tuv whose language is srclang
+    (the source language given in the header of the tmx file) and the target
+    the first other tuv. If srclang is not given, or no tuv is in that
+    language, the first and second tuv are taken in document order.
+    '''
+    tuvs = list(tu.iter('tuv'))
+
+    if srclang:
+        srclang = srclang.lower()
+        for index, tuv in enumerate(tuvs):
+            if (tuv.get(XML_LANG) or tuv.get('lang', '')).lower() == srclang:
+                tuvs.insert(0, tuvs.pop(index))
+                break
+
+    texts = [get_segment_text(tuv) for tuv in tuvs[:2]]
+    texts += [None, None]
+    return texts[0], texts[1]
+
+
+def iter_mapped_checks(translation_file, glossary, workers=1, keep_all=True,
+                       repeats=None):
+    '''
+    Function to read and run the basic check on a translation by memory
+    mapping the tmx file, yielding each segment in order once it has been
+    checked. The mapped file is scanned for tu elements (see tu_offsets),
+    which are divided into ranges parsed and checked by a pool of worker
+    processes, each reading its ranges directly from its own mapping of the
+    file. Only segments with missing terminology are yielded, unless
+    keep_all is True; the repeat digests of the others are passed to
+    repeats (a Repeats object), if given, so that their repetitions are
+    still counted. Files in encodings in which tags cannot be found byte by
+    byte (UTF-16) are read with iter_translation instead.
+    '''
+    try:
+        file = open(translation_file, 'rb')
+    except FileNotFoundError as fnf_error:
+        print(fnf_error)
+        sys.exit()
+
+    with file:
+        if (os.fstat(file.fileno()).st_size == 0 or
+                file.read(2) in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            translation = stream_basic_check(
+                glossary, iter_translation(translation_file))
+            for segment in translation:
+                COUNTERS['mapped_segments'] += 1
+                if keep_all or segment.missing_terms:
+                    yield segment
+                elif repeats is not None:
+                    repeats.mark_clean([segment.repeat_digest()])
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            starts = tu_offsets(data)
+            COUNTERS['mapped_segments'] += len(starts)
+
+            # Source language in the header, which precedes the first tu
+            match = HEADER_SRCLANG.search(data, 0,
+                                          starts[0] if starts else len(data))
+            srclang = match.group(2).decode('ascii', 'replace') if match \
+                else None
+
+            # Ranges of TU_RANGE_SIZE consecutive tu elements, as (start
+            # offset, end offset, position of the first tu, keep_all, source
+            # language) tuples. Each range ends where the next begins, and
+            # the last one at the end tag of the body.
+            ranges = []
+            for first in range(0, len(starts), TU_RANGE_SIZE):
+                last = first + TU_RANGE_SIZE
+                if last < len(starts):
+                    end = starts[last]
+                else:
+                    end = data.find(b'</body>', starts[-1])
+                    if end == -1:
+                        end = len(data)
+                ranges.append((starts[first], end, first, keep_all, srclang))
+
+            if workers > 1 and len(ranges) > 1:
+                with process_pool(workers, init_mapped_worker,
+                                  (translation_file,
+                                   glossary.state())) as pool:
+                    for results, clean_digests in pool.imap(
+                            check_mapped_range, ranges):
+                        for (source_text, target_text, missing, hyphenated,
+                             position, source_terms) in results:
+                            segment = Segment(source_text, target_text,
+                                              missing, hyphenated, position)
+                            segment.source_terms = source_terms
+                            yield segment
+                        if repeats is not None:
+                            repeats.mark_clean(clean_digests)
+            else:
+                for tu_range in ranges:
+                    clean_digests = []
+                    yield from check_range(data, glossary, tu_range,
+                                           clean_digests)
+                    if repeats is not None:
+                        repeats.mark_clean(clean_digests)
+
+
+def tu_offsets(data):
+    '''
+    Function to return an array of the byte offsets at which each tu
+    element starts in a tmx file (as bytes or a memory-mapped file).
+    '''
+    return array('q', (match.start() for match in TU_START.finditer(data)))
+
+
+def init_mapped_worker(translation_file, state):
+    '''
+    Function run when each worker process of a memory-mapped check starts,
+    to map the translation file and set up the glossary from its state.
+    '''
+    with open(translation_file, 'rb') as f:
+        BATCH['mapped'] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    BATCH['mapped_glossary'] = CompiledGlossary(None, state)
+
+
+def check_mapped_range(tu_range):
+    '''
+    Function to check a range of tu elements in a worker process of a
+    memory-mapped check. Returns the source text, target text, missing
+    terms, hyphenated forms, position and source terms of each segment (only
+    of those with missing terminology, unless keep_all), and the repeat
+    digests of the segments left out.
+    '''
+    clean_digests = []
+    results = [(segment.source_text, segment.target_text,
+                dict(segment.missing_terms), dict(segment.hyphenated_forms),
+                segment.position, segment.source_terms)
+               for segment in check_range(BATCH['mapped'],
+                                          BATCH['mapped_glossary'], tu_range,
+                                          clean_digests)]
+    return results, clean_digests
+
+
+def check_range(data, glossary, tu_range, clean_digests=None):
+    '''
+    Function to parse the tu elements between two offsets of a memory-mapped
+    tmx file and run the basic check on their segments, yielding each
+    segment with missing terminology (or every segment, if keep_all) once
+    it has been checked. The repeat digests of the segments which are not
+    yielded are appended to clean_digests, if given. The XML declaration of
+    the file, if any, is parsed first, so that the range is decoded in the
+    same way as the rest of the file, and the source text of each tu is
+    taken from the tuv in the source language of the file (see
+    get_tu_texts).
+    '''
+    start, end, position, keep_all, srclang = tu_range
+
+    parser = ElementTree.XMLPullParser(events=('end',))
+    offset = len(codecs.BOM_UTF8) if data[:3] == codecs.BOM_UTF8 else 0
+    if data[offset:offset + 5] == b'<?xml':
+        parser.feed(data[offset:data.find(b'?>') + 2])
+    parser.feed(b'<body>')
+    with memoryview(data) as view:
+        parser.feed(view[start:end])
+    parser.feed(b'</body>')
+
+    translation = []
+    for _, element in parser.read_events():
+        if element.tag == 'tu':
+            source_text, target_text = get_tu_texts(element, srclang)
+            translation.append(Segment(source_text, target_text,
+                                       position=position))
+            position += 1
+    parser.close()
+
+    for segment in stream_basic_check(glossary, translation):
+        if keep_all or segment.missing_terms:
+            yield segment
+        elif clean_digests is not None:
+            clean_digests.append(segment.repeat_digest())
+
+
+def get_segment_text(tuv):
+    '''
+    Function to return the text of the seg element in a tuv element,
+    including the text of any inline elements, or None if there is no seg.
+    '''
+    seg = tuv.find('seg')
+    if seg is None:
+        return None
+    return ''.join(seg.itertext())
+
+
 def get_terminology(glossary_file):
     '''
     Function to read in terminology from a user-specified txt file.
@@ -119,6 +798,54 @@ def get_terminology(glossary_file):
         return terminology
 
 
+def read_terminology(glossary_file):
+    '''
+    Function to read, clean and group the terminology in a user-specified
+    txt file in a single pass, one line at a time, producing the same
+    grouped terminology dict as get_terminology, clean_lines, format_check,
+    remove_duplicates and group_terminology do together, without holding
+    the lines of the file in memory. Lines that are not blank but do not
+    consist of a source and target term separated by a single tab are
+    ignored, as by format_check, but are also reported.
+    '''
+    grouped_terminology = {}
+    malformed_num = 0
+
+    try:
+        f = open(glossary_file)
+    except FileNotFoundError as fnf_error:
+        print(fnf_error)
+        sys.exit()
+
+    with f:
+        for line_num, line in enumerate(f, 1):
+            entry = line.strip().lstrip('*')
+            split_terms = entry.split('\t')
+
+            if len(split_terms) != 2:
+                if entry:
+                    malformed_num += 1
+                    if malformed_num <= MALFORMED_LINES_SHOWN:
+                        print('\nLine ' + str(line_num) + ' of ' +
+                              glossary_file + ' was ignored, as it does '
+                              'not consist of a source and target term '
+                              'separated by a tab:\n' + line.rstrip('\n'))
+                continue
+
+            source_term, target_term = split_terms
+            target_terms = grouped_terminology.setdefault(source_term, [])
+            # Remove duplicate entries
+            if target_term not in target_terms:
+                target_terms.append(target_term)
+
+    if malformed_num > MALFORMED_LINES_SHOWN:
+        print('\n' + str(malformed_num - MALFORMED_LINES_SHOWN) +
+              ' more lines of ' + glossary_file + ' were ignored.')
+    COUNTERS['malformed_glossary_lines'] += malformed_num
+
+    return grouped_terminology
+
+
 def clean_lines(terminology):
     '''
     Function to clean entries in a terminology list, specifically:
@@ -192,47 +919,695 @@ def group_terminology(terminology):
     return grouped_terminology
 
 
+class TermScanner():
+    '''
+    Used to compile a list of terms (e.g. the source terms of a grouped
+    terminology dict) into an Aho-Corasick automaton, so that every term
+    appearing in a text can be found in a single pass over that text
+    rather than by testing each term separately with "in".
+    '''
+    def __init__(self, terms, tables=None):  # iterable of strings
+        if tables is not None:
+            # Tables of a scanner compiled earlier (see tables())
+            self.terms, self.goto, self.fail, self.output, self.always = \
+                tables
+            return
+
+        self.terms = list(terms)
+        self.goto = [{}]  # list of dicts {char: state}
+        self.fail = [0]  # list of states
+        self.output = [[]]  # list of lists of term indices
+        self.always = []  # indices of empty terms, which match any text
+
+        for index, term in enumerate(self.terms):
+            if not term:
+                self.always.append(index)
+                continue
+            state = 0
+            for char in term:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(index)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        '''
+        Breadth-first pass setting, for each state, the state reached by the
+        longest proper suffix of its path that is also a path in the trie.
+        The outputs of that state are merged in so that a scan only ever
+        needs to look at the output of the current state.
+        '''
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = (self.output[next_state] +
+                                           self.output[self.fail[next_state]])
+                queue.append(next_state)
+
+    def scan(self, text):
+        '''
+        Function to return the terms found in a text, in the order in which
+        they were given to the scanner (each term at most once).
+        '''
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        found = set(self.always)
+        state = 0
+
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+
+        return [self.terms[index] for index in sorted(found)]
+
+    def tables(self):
+        '''
+        Function to return the tables of the automaton, from which the same
+        scanner can be created again without compiling the terms.
+        '''
+        return (self.terms, self.goto, self.fail, self.output, self.always)
+
+
+class CompiledGlossary():
+    '''
+    Used to hold a grouped terminology dict together with the forms derived
+    from it that the checks rely on (source term scanner, normalized target
+    terms and their variants, lemma forms), so that these are worked out
+    once per run rather than again for every segment.
+    '''
+    def __init__(self,
+                 terminology,  # dict {string: list of strings}
+                 state=None):  # dict returned by state(), if compiled before
+        if state is not None:
+            self.terminology = state['terminology']
+            self.scanner = TermScanner(None, state['scanner'])
+            self.normalized_forms = state['normalized_forms']
+            self.variant_forms = state['variant_forms']
+            self.fingerprint = state['fingerprint']
+            self.lemma_forms = {}
+            self.lemma_cache = None
+            return
+
+        self.terminology = terminology
+        self.scanner = TermScanner(terminology)
+
+        # {source term: list of normalized target terms}
+        self.normalized_forms = {}
+        # {source term: list of (normalized variant, variant) tuples}, with
+        # the hyphenated, spaced and joined variants of multi-word and
+        # hyphenated target terms
+        self.variant_forms = {}
+        # {target term: lemma form}, filled in as lemmas are requested
+        self.lemma_forms = {}
+        # LemmaCache consulted before running the NLP pipeline, if any
+        self.lemma_cache = None
+
+        # Hash identifying the content of the glossary
+        content = hashlib.sha1()
+
+        for source_term, target_terms in terminology.items():
+            content.update('\t'.join([source_term] + target_terms).encode())
+            content.update(b'\n')
+            self.normalized_forms[source_term] = [normalize_text(x)
+                                                  for x in target_terms]
+            self.variant_forms[source_term] = term_variants(
+                target_terms, self.normalized_forms[source_term])
+
+        self.fingerprint = content.hexdigest()
+
+    def source_terms(self, segment):
+        '''
+        Function to return the source terms found in the source text of a
+        segment. The text is only scanned the first time, the terms being
+        kept with the segment for the checks and records that follow. They
+        are kept with the fingerprint of the glossary, so that the text is
+        scanned again if the segment is checked with another glossary.
+        '''
+        if (segment.source_terms is None or
+                segment.source_terms[0] != self.fingerprint):
+            segment.source_terms = (self.fingerprint, self.scanner.scan(
+                segment.source_text or ''))
+        return segment.source_terms[1]
+
+    def state(self):
+        '''
+        Function to return everything worked out from the terminology (except
+        lemma forms, which depend on the NLP pipeline) as a dict of built-in
+        types, from which the glossary can be created again.
+        '''
+        return {'terminology': self.terminology,
+                'scanner': self.scanner.tables(),
+                'normalized_forms': self.normalized_forms,
+                'variant_forms': self.variant_forms,
+                'fingerprint': self.fingerprint}
+
+    def lemma(self, target_term, nlp):
+        '''
+        Function to return the lemma form of a target term, running the NLP
+        pipeline only the first time a given term is requested and only if
+        the term is not in the lemma cache.
+        '''
+        if target_term not in self.lemma_forms:
+            lemma_form = None
+            if self.lemma_cache is not None:
+                lemma_form = self.lemma_cache.get(target_term)
+            if lemma_form is None:
+                lemma_form = get_lemma(target_term, nlp)
+                if self.lemma_cache is not None:
+                    self.lemma_cache.put(target_term, lemma_form)
+            self.lemma_forms[target_term] = lemma_form
+        return self.lemma_forms[target_term]
+
+    def lemmatize(self, target_terms, nlp, batch_size=None):
+        '''
+        Function to work out the lemma forms of many target terms at once.
+        The terms whose lemma forms are neither known nor in the lemma cache
+        are streamed through nlp.pipe in batches of batch_size (spaCy's
+        default if None), rather than parsed one at a time.
+        '''
+        pending = []
+        for target_term in dict.fromkeys(target_terms):
+            if target_term in self.lemma_forms:
+                continue
+            lemma_form = None
+            if self.lemma_cache is not None:
+                lemma_form = self.lemma_cache.get(target_term)
+            if lemma_form is None:
+                pending.append(target_term)
+            else:
+                self.lemma_forms[target_term] = lemma_form
+
+        docs = nlp.pipe(pending, batch_size=batch_size)
+        for target_term, doc in zip(pending, docs):
+            lemma_form = get_lemma(target_term, nlp, doc)
+            if self.lemma_cache is not None:
+                self.lemma_cache.put(target_term, lemma_form)
+            self.lemma_forms[target_term] = lemma_form
+
+
+def compile_glossary(terminology):
+    '''
+    Function to return a CompiledGlossary for a grouped terminology dict.
+    Glossaries that have already been compiled are returned as they are.
+    '''
+    if isinstance(terminology, CompiledGlossary):
+        return terminology
+    return CompiledGlossary(terminology)
+
+
+def normalize_text(text, join_lines=True):
+    '''
+    Function to return the form of a text in which target terms are looked
+    for: case-folded, with line-break hyphenation and soft hyphens removed,
+    dashes replaced by hyphens and each run of whitespace (including
+    non-breaking spaces and line breaks) replaced by a single space. If
+    join_lines is False, line-break hyphenation is kept as a hyphen instead.
+    '''
+    if '\n' in text:
+        text = LINE_BREAK_HYPHEN.sub('' if join_lines else '-', text)
+    if not text.isascii():
+        text = text.translate(DASH_FORMS)
+    return ' '.join(text.split()).casefold()
+
+
+def term_variants(target_terms, normalized_terms):
+    '''
+    Function to return the variants of a list of target terms which are
+    reported, though not accepted, when found in place of the terms
+    themselves: multi-word terms hyphenated, hyphenated terms spaced and
+    either written as one word. Variants are returned as (normalized
+    variant, variant) tuples, excluding any that are target terms.
+    '''
+    variants = []
+    seen = set(normalized_terms)
+
+    for target_term in target_terms:
+        form = ' '.join(target_term.translate(DASH_FORMS).split())
+        if ' ' not in form and '-' not in form:
+            continue
+        for variant in (form.replace(' ', '-'),
+                        form.replace('-', ' '),
+                        form.replace(' ', '').replace('-', '')):
+            normalized = variant.casefold()
+            if normalized not in seen:
+                seen.add(normalized)
+                variants.append((normalized, variant))
+
+    return variants
+
+
+def normalize_target(text):
+    '''
+    Function to return the normalized form of a target text in which target
+    terms are looked for. Line-break hyphenation is ambiguous (the hyphen
+    may belong to the word), so for a text containing any, the form with
+    the lines joined and the form with the hyphens kept are both returned,
+    separated by a null character, which no term can match across.
+    '''
+    if '\n' in text and LINE_BREAK_HYPHEN.search(text):
+        return (normalize_text(text) + '\0' +
+                normalize_text(text, join_lines=False))
+    return normalize_text(text)
+
+
+class LemmaCache():
+    '''
+    Used to keep the lemma forms of target terms in an SQLite database
+    between runs. The cache is emptied whenever its key (which identifies
+    the glossary and NLP model the lemmas were obtained with) changes, and
+    holds at most max_size terms, the least recently used being removed
+    when the cache is closed.
+    '''
+    def __init__(self, path, key, max_size=LEMMA_CACHE_SIZE):
+        self.max_size = max_size
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta '
+                                '(name TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS lemmas '
+                                '(term TEXT PRIMARY KEY, lemma TEXT, '
+                                'last_run INTEGER)')
+        meta = dict(self.connection.execute('SELECT name, value FROM meta'))
+
+        # Discard everything stored under a different key
+        if meta.get('key') != key:
+            self.connection.execute('DELETE FROM lemmas')
+            meta = {'key': key, 'run': '0'}
+
+        # Runs are numbered so that terms can be ordered by last use
+        self.run = int(meta['run']) + 1
+        self.connection.executemany('REPLACE INTO meta VALUES (?, ?)',
+                                    [('key', key), ('run', str(self.run))])
+
+        self.lemmas = dict(self.connection.execute('SELECT term, lemma '
+                                                   'FROM lemmas'))
+        self.used = set()  # terms looked up during this run
+        self.new = {}  # {term: lemma} added during this run
+
+    def get(self, term):
+        '''
+        Function to return the cached lemma form of a term, or None.
+        '''
+        lemma_form = self.lemmas.get(term)
+        if lemma_form is None:
+            COUNTERS['lemma_cache_misses'] += 1
+        else:
+            COUNTERS['lemma_cache_hits'] += 1
+            self.used.add(term)
+        return lemma_form
+
+    def put(self, term, lemma_form):
+        '''
+        Function to add the lemma form of a term to the cache.
+        '''
+        self.lemmas[term] = lemma_form
+        self.new[term] = lemma_form
+
+    def close(self):
+        '''
+        Function to write the terms used or added during this run to the
+        database, remove the least recently used terms beyond max_size, and
+        close the database.
+        '''
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE lemmas SET last_run = ? WHERE term = ?',
+                ((self.run, term) for term in self.used))
+            self.connection.executemany(
+                'REPLACE INTO lemmas VALUES (?, ?, ?)',
+                ((term, lemma, self.run) for term, lemma in self.new.items()))
+            self.connection.execute(
+                'DELETE FROM lemmas WHERE term NOT IN '
+                '(SELECT term FROM lemmas ORDER BY last_run DESC LIMIT ?)',
+                (self.max_size,))
+        self.connection.close()
+
+
+class FingerprintStore():
+    '''
+    Used to keep the results of checking each segment of a translation
+    between runs, in a JSON file. Results are stored by fingerprint (a hash
+    of the source and target text) together with the source terms found in
+    the segment, and are reused in a later run if the segment is unchanged
+    and none of the glossary entries for those source terms have changed.
+    '''
+    def __init__(self, path, glossary, key):
+        self.path = path
+        self.glossary = glossary
+        self.key = key
+
+        # {source term: hash of its target terms}
+        self.entries = {source_term: hash_entry(target_terms)
+                        for source_term, target_terms
+                        in glossary.terminology.items()}
+
+        # Results of the previous run, and those of this run:
+        # {fingerprint: {'terms': list of source terms,
+        #                'missing': {source term: list of target terms},
+        #                'hyphenated': {source term: hyphenated form}}}
+        self.previous_entries = {}
+        self.previous = {}
+        self.records = {}
+
+        try:
+            with open(path, encoding='utf-8') as file:
+                stored = json.load(file)
+        except (FileNotFoundError, ValueError):
+            stored = {}
+        if stored.get('key') == key:
+            self.previous_entries = stored['entries']
+            self.previous = stored['segments']
+
+    def reuse(self, translation):
+        '''
+        Function to give each segment whose results can be reused from the
+        previous run those results, yielding each segment. As with
+        repetitions (see find_repeats), such segments are not checked, but
+        have as repeat_of a segment holding the previous results.
+        '''
+        for segment in translation:
+            if segment.repeat_of is None:
+                fingerprint = fingerprint_segment(segment)
+                record = self.previous.get(fingerprint)
+                if record is not None and self.is_current(segment, record):
+                    self.records[fingerprint] = record
+                    segment.repeat_of = Segment(segment.source_text,
+                                                segment.target_text,
+                                                record['missing'],
+                                                record['hyphenated'])
+                    COUNTERS['reused_segments'] += 1
+            yield segment
+
+    def is_current(self, segment, record):
+        '''
+        Function to check whether the glossary entries that apply to a
+        segment are the same as when its record was stored.
+        '''
+        terms = self.glossary.source_terms(segment)
+        return (terms == record['terms'] and
+                all(self.entries[term] == self.previous_entries.get(term)
+                    for term in terms))
+
+    def record(self, translation):
+        '''
+        Function to store the results of each segment that has been checked
+        in this run, yielding each segment.
+        '''
+        for segment in translation:
+            if segment.repeat_of is None:
+                self.records[fingerprint_segment(segment)] = {
+                    'terms': self.glossary.source_terms(segment),
+                    'missing': dict(segment.missing_terms),
+                    'hyphenated': dict(segment.hyphenated_forms)}
+            yield segment
+
+    def update(self, translation):
+        '''
+        Function to update the stored results of segments that have been
+        through further checks since they were recorded, yielding each
+        segment.
+        '''
+        for segment in translation:
+            if segment.repeat_of is None:
+                record = self.records[fingerprint_segment(segment)]
+                record['missing'] = dict(segment.missing_terms)
+                record['hyphenated'] = dict(segment.hyphenated_forms)
+            yield segment
+
+    def save(self):
+        '''
+        Function to write the results of this run to the JSON file.
+        '''
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump({'key': self.key,
+                       'entries': self.entries,
+                       'segments': self.records},
+                      file, ensure_ascii=False)
+        os.replace(temporary_path, self.path)
+
+
+def fingerprint_segment(segment):
+    '''
+    Function to return a hash of the source and target text of a segment.
+    '''
+    text = (segment.source_text or '') + '\0' + (segment.target_text or '')
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def hash_entry(target_terms):
+    '''
+    Function to return a hash of the target terms of a glossary entry.
+    '''
+    return hashlib.sha1('\t'.join(target_terms).encode()).hexdigest()
+
+
+def fingerprint_store_key(options):
+    '''
+    Function to return the key under which results obtained with the given
+    command line options are stored for incremental runs.
+    '''
+    return '|'.join([str(FINGERPRINT_STORE_VERSION),
+                     'spacy-' + spacy_version(),
+                     SPACY_MODEL + '-' + spacy_version(SPACY_MODEL),
+                     options.get('pipeline', 'full')])
+
+
+def spacy_version(package='spacy'):
+    '''
+    Function to return the version of spaCy (or of another package, such as
+    the spaCy model) installed, without importing it.
+    '''
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return 'none'
+
+
+def lemma_cache_key(glossary, nlp):
+    '''
+    Function to return the key under which lemma forms obtained for a
+    compiled glossary with a given NLP pipeline are cached.
+    '''
+    return '|'.join([str(LEMMA_CACHE_VERSION),
+                     glossary.fingerprint,
+                     'spacy-' + spacy_version(),
+                     nlp.meta['lang'] + '_' + nlp.meta['name'] +
+                     '-' + nlp.meta['version'],
+                     '+'.join(nlp.pipe_names)])
+
+
 def basic_check(terminology, translation):
     '''
     Function for running a basic check to see whether the target text in a
     translation segment contains correct terminology. A basic check here means
-    simply using "in" to see whether correct terminology is included in the
-    target text.
+    using "in" to see whether correct terminology is included in the target
+    text, once both are normalized (see normalize_text). Source terms are
+    found using the scanner of the compiled glossary. Variants of the target
+    terms found in place of them (see term_variants) are recorded as their
+    hyphenated forms in the same pass.
     '''
+    translation = list(stream_basic_check(terminology, translation))
+    missing = any(segment.missing_terms for segment in translation)
+    return translation, missing
 
-    missing = False
+
+def stream_basic_check(terminology, translation):
+    '''
+    Generator version of basic_check, yielding each segment of a translation
+    (which can itself be a generator) once it has been checked. Repetitions
+    found by find_repeats are not checked.
+    '''
+    glossary = compile_glossary(terminology)
 
     for segment in translation:
 
         # Only proceed if there is actual source and target text
-        if contains_content(segment):
+        if segment.repeat_of is None and contains_content(segment):
 
             # Check if any source terminology is in the source text
-            for entry in terminology:
-                if entry in segment.source_text:
+            entries = glossary.source_terms(segment)
+
+            if entries:
+                # Normalize the target text once for all source terms
+                text = normalize_target(segment.target_text)
 
-                    # Case-insensitive comparison to find target terms
-                    text = segment.target_text.lower()
-                    terms = [x.lower() for x in terminology[entry]]
+                for entry in entries:
 
                     # Check if any of the corresponding target terms
                     # appear in the target text
-                    found = any(elem in text for elem in terms)
+                    terms = glossary.normalized_forms[entry]
+                    if any(elem in text for elem in terms):
+                        continue
 
-                    if not found:
-                        segment.missing_terms[entry] = terminology[entry]
-                        missing = True
+                    segment.add_missing_term(entry,
+                                             glossary.terminology[entry])
+
+                    # Record the first variant of a target term found
+                    for form, variant in glossary.variant_forms[entry]:
+                        if form in text:
+                            segment.add_hyphenated_form(entry, variant)
+                            break
+
+        yield segment
+
+
+def find_repeats(translation):
+    '''
+    Function to mark each segment in a translation whose source and target
+    text (ignoring differences in whitespace) are the same as those of an
+    earlier segment as a repeat of that segment, yielding each segment.
+    Repetitions are not checked themselves, but given the results of the
+    earlier segment by copy_repeats.
+    '''
+    return Repeats().mark(translation)
+
+
+class Repeats():
+    '''
+    Used to find repetitions in a translation (see find_repeats). Segments
+    are identified by a digest of their repeat key, and once checked, the
+    first segment with each digest is only kept if it has missing
+    terminology (see forget_clean), so that memory use grows by a digest
+    rather than a segment for each distinct segment.
+    '''
+    def __init__(self):
+        # {repeat digest: first segment with that digest, or CLEAN_SEGMENT}
+        self.first_segments = {}
+
+    def mark(self, translation):
+        '''
+        Function to mark each repetition in a translation as a repeat of the
+        first segment with the same repeat key, yielding each segment.
+        '''
+        first_segments = self.first_segments
+
+        for segment in translation:
+            first_segment = first_segments.setdefault(
+                segment.repeat_digest(), segment)
+            if first_segment is not segment:
+                segment.repeat_of = first_segment
+                COUNTERS['repeated_segments'] += 1
+            yield segment
+
+    def mark_clean(self, digests):
+        '''
+        Function to record the repeat digests of segments without missing
+        terminology which are not passed to mark (as with --mmap), counting
+        those repeating an earlier segment. As a segment with missing
+        terminology never has the same digest as one without, they can be
+        recorded in any order relative to the segments passed to mark.
+        '''
+        first_segments = self.first_segments
+
+        for digest in digests:
+            if digest in first_segments:
+                COUNTERS['repeated_segments'] += 1
+            else:
+                first_segments[digest] = CLEAN_SEGMENT
+
+    def forget_clean(self, translation):
+        '''
+        Function to replace each first segment without missing terminology
+        by CLEAN_SEGMENT once it has been through the basic check (and again
+        after the lemma check, for those it finds to have none), yielding
+        each segment. Later repetitions of it then have CLEAN_SEGMENT, which
+        has nothing to report, as repeat_of.
+        '''
+        first_segments = self.first_segments
+
+        for segment in translation:
+            if (segment.repeat_of is not CLEAN_SEGMENT and
+                    not original_segment(segment).missing_terms):
+                digest = segment.repeat_digest()
+                if first_segments.get(digest) is segment:
+                    first_segments[digest] = CLEAN_SEGMENT
+            yield segment
+
+
+def copy_repeats(translation):
+    '''
+    Function to give each repetition marked by find_repeats the missing terms
+    and hyphenated forms of the segment it repeats, yielding each segment.
+    The repeated segment must have been checked first, which is the case
+    when segments pass through the checks in order.
+    '''
+    for segment in translation:
+        first_segment = original_segment(segment)
+        if first_segment is not segment:
+            if first_segment.missing_terms:
+                segment.missing_terms = dict(first_segment.missing_terms)
+            if first_segment.hyphenated_forms:
+                segment.hyphenated_forms = dict(
+                    first_segment.hyphenated_forms)
+        yield segment
+
+
+def clear_repeats(translation):
+    '''
+    Function to remove the results of the basic check from repetitions and
+    reused segments which were checked before being marked as such (as with
+    --mmap), yielding each segment. They are given the results of the
+    segment they repeat by copy_repeats, as when they are not checked.
+    '''
+    for segment in translation:
+        if segment.repeat_of is not None:
+            segment.missing_terms = NO_FINDINGS
+            segment.hyphenated_forms = NO_FINDINGS
+        yield segment
+
+
+def needs_checking(segment):
+    '''
+    Function to check whether a segment (or the segment it repeats) still
+    has missing terminology after the basic check, i.e. whether it needs to
+    go through the lemma check and be reported.
+    '''
+    return bool(original_segment(segment).missing_terms)
 
-    return translation, missing
 
+def original_segment(segment):
+    '''
+    Function to return the segment whose results a segment reuses (following
+    repeats of repeats), or the segment itself if it was checked.
+    '''
+    while segment.repeat_of is not None:
+        segment = segment.repeat_of
+    return segment
 
-def setup_tokenizer():
+
+def setup_tokenizer(profile='full'):
     '''
     Function to set up a tokenizer with specific rules to not split words or
-    numbers that include hyphens.
+    numbers that include hyphens. The profile selects which pipeline
+    components are loaded (see PIPELINE_EXCLUDES).
     '''
+    import spacy
+    from spacy.tokenizer import Tokenizer
+    from spacy.util import compile_infix_regex
+
+    nlp = spacy.load(SPACY_MODEL, exclude=PIPELINE_EXCLUDES[profile])
 
-    nlp = spacy.load('en_core_web_sm')
+    # Lemmatize using lookup tables rather than part-of-speech based rules
+    if profile == 'lookup':
+        lemmatizer = nlp.add_pipe('lemmatizer', config={'mode': 'lookup'})
+        lemmatizer.initialize()
 
     # Default infixes
     inf = list(nlp.Defaults.infixes)
@@ -260,56 +1635,356 @@ def setup_tokenizer():
     return nlp
 
 
-def lemma_check(nlp, terminology, translation):
+def parse_segments(nlp, translation, batch_size=None, n_process=1):
+    '''
+    Function to parse the target text of each segment in which missing
+    terminology has been found, yielding (segment, doc) pairs in segment
+    order. Each target text is parsed exactly once, and segments without
+    missing terminology are not parsed at all (their doc is None).
+    The target texts are streamed through nlp.pipe, so they are processed in
+    batches of batch_size (spaCy's default if None), and across n_process
+    processes if n_process is greater than 1.
+    '''
+    segments = ((segment, bool(segment.missing_terms))
+                for segment in translation)
+
+    # The segments themselves stay in this process; only their target texts
+    # are sent to nlp.pipe, and the docs come back in the same order
+    segments, texts = itertools.tee(segments)
+    texts = (segment.target_text for segment, needs_nlp in texts if needs_nlp)
+    docs = PROFILER.stage('spacy', nlp.pipe(texts, batch_size=batch_size,
+                                            n_process=n_process))
+
+    for segment, needs_nlp in segments:
+        if needs_nlp:
+            COUNTERS['segments_needing_nlp'] += 1
+            COUNTERS['target_parses'] += 1
+            yield segment, next(docs)
+        else:
+            yield segment, None
+
+
+def lemma_check(nlp, terminology, translation, batch_size=None, n_process=1):
     '''
     Function for checking whether the target text in a translation segment
     contains a correct target term in its lemma form.
+    batch_size and n_process are passed on to parse_segments.
     '''
 
-    for segment in translation:
+    for segment in stream_lemma_check(nlp, terminology, translation,
+                                      batch_size, n_process):
+        pass
 
-        # Only proceed if missing terminology has been found
-        if segment.missing_terms:
+    return translation
 
-            # List of entries to remove from missing_terms if found
-            to_remove = []
 
-            # Only look at terminolgy registered as missing
-            for source_term in segment.missing_terms:
-                for target_term in segment.missing_terms[source_term]:
+def stream_lemma_check(nlp, terminology, translation,
+                       batch_size=None, n_process=1):
+    '''
+    Generator version of lemma_check, yielding each segment of a translation
+    once it has been checked.
+    '''
 
-                    # Get the lemma form of the target term
-                    target_term_lemma = get_lemma(target_term, nlp)
+    glossary = compile_glossary(terminology)
 
-                    # Check if target_term_lemma appears in target text
-                    found = target_search(target_term_lemma,
-                                          segment.target_text,
-                                          nlp)
+    # Only segments in which missing terminology has been found are parsed
+    for segment, doc in parse_segments(nlp, translation,
+                                       batch_size, n_process):
+        if doc is not None:
+            check_lemmas(nlp, glossary, segment, doc)
+        yield segment
 
-                    if found:
-                        to_remove.append(source_term)
 
-            # Remove found terms from the missing terms dict
-            if to_remove:
-                for entry in to_remove:
-                    if entry in segment.missing_terms:
-                        del segment.missing_terms[entry]
+def check_lemmas(nlp, glossary, segment, doc):
+    '''
+    Function to remove from the missing terms of a segment those whose
+    target terms appear in its target text (parsed as doc) in lemma form.
+    '''
+    # Get the lemma forms of the target terms registered as missing
+    target_term_lemmas = {}
+    for target_terms in segment.missing_terms.values():
+        for target_term in target_terms:
+            target_term_lemmas[target_term] = glossary.lemma(target_term, nlp)
 
-    return translation
+    # Check which of these appear in the target text, all at once
+    found = match_lemmas(doc, target_term_lemmas.values())
+
+    # List of entries to remove from missing_terms if found
+    to_remove = []
+    for source_term, target_terms in segment.missing_terms.items():
+        if any(target_term_lemmas[target_term] in found
+               for target_term in target_terms):
+            to_remove.append(source_term)
+
+    # Remove found terms from the missing terms dict
+    for entry in to_remove:
+        del segment.missing_terms[entry]
+
+
+class TermChecker():
+    '''
+    Used to check one segment at a time, e.g. each time a segment is
+    confirmed in an editor. The glossary is compiled and the NLP pipeline
+    loaded once, when the checker is created, and the findings of the
+    cache_size most recently checked segments are kept, so that checking a
+    segment again (or one differing only in whitespace) runs no checks.
+    '''
+    def __init__(self,
+                 terminology,  # dict {string: list of strings}
+                 nlp=None,  # loaded with setup_tokenizer() if None
+                 cache_size=CHECKER_CACHE_SIZE):
+        self.glossary = compile_glossary(terminology)
+        self.nlp = nlp if nlp is not None else setup_tokenizer()
+        self.cache_size = cache_size
+        # {repeat key: tuple of Finding objects}, least recently used first
+        self.results = OrderedDict()
+
+    def check_segment(self, source_text, target_text):
+        '''
+        Function to check a single segment, returning a tuple of Finding
+        objects (empty if no terminology errors were found).
+        '''
+        segment = Segment(source_text, target_text)
+        key = segment.repeat_key()
+
+        findings = self.results.get(key)
+        if findings is not None:
+            COUNTERS['checker_cache_hits'] += 1
+            self.results.move_to_end(key)
+            return findings
+
+        segment = next(stream_basic_check(self.glossary, [segment]))
+
+        # Only parse the target text if missing terminology was found
+        if segment.missing_terms:
+            COUNTERS['target_parses'] += 1
+            check_lemmas(self.nlp, self.glossary, segment,
+                         self.nlp(segment.target_text))
+
+        findings = tuple(segment.findings())
+        self.results[key] = findings
+        if len(self.results) > self.cache_size:
+            self.results.popitem(last=False)
+        return findings
 
 
-def get_lemma(input_string, nlp):
+def index_check(nlp, terminology, translation, batch_size=None, n_process=1):
+    '''
+    Alternative to lemma_check which parses the target text of every segment
+    in a translation (a list) once to build a LemmaIndex, then checks all of
+    the missing terminology against the index. Returns the translation and
+    the index, which can be used for further queries.
+    '''
+    glossary = compile_glossary(terminology)
+    index = LemmaIndex()
+
+    texts = (segment.target_text if contains_content(segment) else ''
+             for segment in translation)
+    for segment_id, doc in enumerate(nlp.pipe(texts,
+                                              batch_size=batch_size,
+                                              n_process=n_process)):
+        COUNTERS['target_parses'] += 1
+        index.add(segment_id, doc)
+
+    # Group the segments to look at by target term lemma:
+    # {target term lemma: set of segment ids}
+    segment_ids = {}
+    for segment_id, segment in enumerate(translation):
+        for target_terms in segment.missing_terms.values():
+            for target_term in target_terms:
+                target_term_lemma = glossary.lemma(target_term, nlp)
+                segment_ids.setdefault(target_term_lemma, set()).add(
+                    segment_id)
+
+    # {target term lemma: set of segment ids in which it was found}
+    found = {target_term_lemma: index.find(target_term_lemma, ids)
+             for target_term_lemma, ids in segment_ids.items()}
+
+    for segment_id, segment in enumerate(translation):
+
+        # List of entries to remove from missing_terms if found
+        to_remove = []
+        for source_term, target_terms in segment.missing_terms.items():
+            if any(segment_id in found[glossary.lemma(target_term, nlp)]
+                   for target_term in target_terms):
+                to_remove.append(source_term)
+
+        for entry in to_remove:
+            del segment.missing_terms[entry]
+
+    return translation, index
+
+
+class LemmaIndex():
+    '''
+    Used to index the target text of a whole translation, recording for
+    each lowercase lemma and each lowercase word the segments (by id) and
+    token positions at which it appears. Whether a target term lemma (see
+    get_lemma) is used in a segment can then be answered by looking up its
+    words and checking that their positions are adjacent.
+    '''
+    def __init__(self):
+        self.lemmas = {}  # {lemma: {segment id: list of positions}}
+        self.words = {}  # {word: {segment id: list of positions}}
+
+    def add(self, segment_id, doc):
+        '''
+        Function to add the tokens of a parsed segment to the index.
+        '''
+        for position, token in enumerate(doc):
+            COUNTERS['tokens_processed'] += 1
+            for table, key in [(self.lemmas, token.lemma_.lower()),
+                               (self.words, token.lower_)]:
+                table.setdefault(key, {}).setdefault(segment_id, []).append(
+                    position)
+
+    def find(self, target_term_lemma, segment_ids=None):
+        '''
+        Function to return the set of ids of the segments in which a target
+        term lemma appears, optionally only looking at the given segments.
+        As in match_lemmas, the end word of the term is compared with lemmas
+        and any preceding words with the words of the text.
+        '''
+        subwords = target_term_lemma.lower().split()
+        if not subwords:
+            return set()
+
+        # Segments containing every word of the term, in any position
+        postings = [self.words.get(x, {}) for x in subwords[:-1]]
+        postings.append(self.lemmas.get(subwords[-1], {}))
+        candidates = set(postings[-1])
+        if segment_ids is not None:
+            candidates &= set(segment_ids)
+        for posting in postings[:-1]:
+            candidates &= posting.keys()
+
+        # Keep the segments in which the words are adjacent and in order
+        found = set()
+        for segment_id in candidates:
+            positions = [set(posting[segment_id]) for posting in postings]
+            for end in positions[-1]:
+                start = end - len(subwords) + 1
+                if all(start + j in positions[j]
+                       for j in range(len(subwords) - 1)):
+                    found.add(segment_id)
+                    break
+
+        return found
+
+
+class OccurrenceMatrix():
+    '''
+    Used to record which glossary source terms occur in which segments of a
+    translation, i.e. a sparse matrix of segments x source terms, together
+    with a parallel matrix recording in which of those segments the source
+    term was correctly translated (i.e. is not reported as missing). The
+    matrices are held as flat arrays of (segment id, term id, translated)
+    entries, from which statistics for every term are computed at once.
+    '''
+    def __init__(self, terminology):
+        self.glossary = compile_glossary(terminology)
+        self.terms = list(self.glossary.terminology)
+        self.term_ids = {term: term_id
+                         for term_id, term in enumerate(self.terms)}
+        self.segment_num = 0
+
+        # One entry per occurrence of a source term in a segment
+        self.segment_ids = array('I')
+        self.term_ids_used = array('I')
+        self.translated = bytearray()
+
+        # {segment: (first entry, last entry + 1)} for segments whose
+        # missing terms may still be found by later checks
+        self.pending = {}
+
+    def record(self, translation):
+        '''
+        Function to record the source terms occurring in each segment of a
+        translation once it has been through the basic check (which found
+        them), yielding each segment. Entries for segments with missing terms
+        are completed by resolve, once the remaining checks have been run.
+        '''
+        glossary = self.glossary
+
+        for segment in translation:
+            segment_id = self.segment_num
+            self.segment_num += 1
+
+            if contains_content(segment):
+                missing_terms = original_segment(segment).missing_terms
+                start = len(self.translated)
+                for term in glossary.source_terms(segment):
+                    self.segment_ids.append(segment_id)
+                    self.term_ids_used.append(self.term_ids[term])
+                    self.translated.append(term not in missing_terms)
+                if missing_terms:
+                    self.pending[segment] = (start, len(self.translated))
+
+            yield segment
+
+    def resolve(self, translation):
+        '''
+        Function to update the entries of each segment that has been through
+        the remaining checks, yielding each segment.
+        '''
+        for segment in translation:
+            entries = self.pending.pop(segment, None)
+            if entries is not None:
+                for entry in range(*entries):
+                    term = self.terms[self.term_ids_used[entry]]
+                    self.translated[entry] = (term not in
+                                              segment.missing_terms)
+            yield segment
+
+    def term_stats(self):
+        '''
+        Function to return, for each source term in glossary order, the
+        number of segments in which it occurs and the number of these in
+        which it was correctly translated.
+        '''
+        import numpy
+
+        term_ids = numpy.frombuffer(self.term_ids_used, dtype=numpy.uint32)
+        translated = numpy.frombuffer(self.translated, dtype=numpy.bool_)
+        occurrences = numpy.bincount(term_ids, minlength=len(self.terms))
+        compliant = numpy.bincount(term_ids[translated],
+                                   minlength=len(self.terms))
+
+        return list(zip(self.terms, occurrences.tolist(), compliant.tolist()))
+
+    def segments(self, term, translated=None):
+        '''
+        Function to return the ids of the segments in which a source term
+        occurs, optionally only those in which it was (or was not)
+        correctly translated.
+        '''
+        import numpy
+
+        term_ids = numpy.frombuffer(self.term_ids_used, dtype=numpy.uint32)
+        selected = term_ids == self.term_ids[term]
+        if translated is not None:
+            selected &= (numpy.frombuffer(self.translated, dtype=numpy.bool_)
+                         == translated)
+        segment_ids = numpy.frombuffer(self.segment_ids, dtype=numpy.uint32)
+        return segment_ids[selected].tolist()
+
+
+def get_lemma(input_string, nlp, doc=None):
     '''
     Function to return the lemma version of an input string.
     A lemma version being:
        - for a single-word string, the lemma of that single word
        - for a multi-word string, the same string except that the end word
             is replaced with its lemma form
+    If the input string has already been parsed, its doc can be passed in to
+    avoid parsing it again.
     '''
 
     # Get end word lemma, regardless of the number of words
     subwords = input_string.split()
-    doc = nlp(input_string)
+    COUNTERS['term_parses'] += 1
+    if doc is None:
+        doc = nlp(input_string)
     end_word_lemma = doc[-1].lemma_
 
     # If the input string contains more than one word, rebuild the input
@@ -323,33 +1998,83 @@ def get_lemma(input_string, nlp):
     return lemma_form
 
 
-def target_search(target_term_lemma, target_text, nlp):
+def target_search(target_term_lemma, target_text, nlp, doc=None):
     '''
     Function to check whether the lemma version of a target term appears in
-    the target text of a given translation segment.
+    the target text of a given translation segment. If the target text has
+    already been parsed, its doc can be passed in to avoid parsing it again.
+    '''
+
+    if doc is None:
+        COUNTERS['target_parses'] += 1
+        doc = nlp(target_text)
+
+    return target_term_lemma in match_lemmas(doc, [target_term_lemma])
+
+
+def doc_arrays(doc):
     '''
+    Function to return two arrays holding, for each token in a doc, the hash
+    of its lowercase text and the hash of its lowercase lemma.
+    '''
+    import numpy
+    from spacy.attrs import LEMMA, LOWER
 
-    found = False
-    doc = nlp(target_text)
-    subwords = target_term_lemma.split()
-    subword_no = len(subwords)
-    target_end_lemma = subwords[-1]
+    strings = doc.vocab.strings
+    array = doc.to_array([LOWER, LEMMA]).astype(numpy.uint64)
+    COUNTERS['tokens_processed'] += len(array)
 
-    for i in range(len(doc)):
+    # Lowercase each distinct lemma once rather than once per token
+    lemmas, inverse = numpy.unique(array[:, 1], return_inverse=True)
+    lower_lemmas = numpy.array([strings.add(strings[lemma].lower())
+                                for lemma in lemmas.tolist()],
+                               dtype=numpy.uint64)
 
-        # Look for a lemma that matches the end target term lemma
-        if doc[i].lemma_.lower() == target_end_lemma.lower():
+    return array[:, 0], lower_lemmas[inverse.reshape(-1)]
 
-            found_term = doc[i].lemma_
 
-            # If necessary, get the preceding words to build the whole term
-            if subword_no > 1:
-                for j in range(1, subword_no):
-                    found_term = doc[i - j].text + ' ' + found_term
+def match_lemmas(doc, target_term_lemmas):
+    '''
+    Function to return the set of target term lemmas (see get_lemma) that
+    appear in a doc. The end word of a term is compared with the lemmas of
+    the tokens and any preceding words with the text of the tokens before
+    them, ignoring case.
+    Terms with the same number of words are compared with every run of that
+    many tokens at once, using arrays of string hashes.
+    '''
+    import numpy
 
-            # Compare found term with target term
-            if found_term.lower() == target_term_lemma.lower():
-                found = True
+    strings = doc.vocab.strings
+    lower, lemma = doc_arrays(doc)
+    token_no = len(lower)
+
+    # Group the terms by number of words: {word number: [(term, hashes)]}
+    terms_by_length = {}
+    for target_term_lemma in set(target_term_lemmas):
+        subwords = target_term_lemma.lower().split()
+        if subwords and len(subwords) <= token_no:
+            terms_by_length.setdefault(len(subwords), []).append(
+                (target_term_lemma, [strings.add(x) for x in subwords]))
+
+    found = set()
+
+    for subword_no, terms in terms_by_length.items():
+
+        # Each row holds a run of subword_no tokens: the lowercase text of
+        # all but the last token, then the lowercase lemma of the last one
+        window_no = token_no - subword_no + 1
+        windows = numpy.empty((window_no, subword_no), dtype=numpy.uint64)
+        for j in range(subword_no - 1):
+            windows[:, j] = lower[j:j + window_no]
+        windows[:, -1] = lemma[subword_no - 1:]
+
+        # Compare every term with every run: (terms, runs, words)
+        hashes = numpy.array([x[1] for x in terms], dtype=numpy.uint64)
+        matches = (windows[numpy.newaxis, :, :] ==
+                   hashes[:, numpy.newaxis, :]).all(axis=2).any(axis=1)
+
+        found.update(term for (term, _), match in zip(terms, matches)
+                     if match)
 
     return found
 
@@ -369,99 +2094,1396 @@ def contains_content(segment):
 
 def hyphen_check(terminology, translation):
     '''
-    Function to check if hyphenated forms of missing terms appear in the
-    target text. If the hyphenated form is found in the target text, this
-    is not treated as an error, but rather a message indicating this is output.
+    Function to check if hyphenated forms (or other variants, see
+    term_variants) of missing terms appear in the target text. If a variant
+    is found in the target text, this is not treated as an error, but rather
+    a message indicating this is output. The basic check already records
+    the variants it finds, so this only affects segments checked otherwise.
     '''
+    return list(stream_hyphen_check(terminology, translation))
+
+
+def stream_hyphen_check(terminology, translation):
+    '''
+    Generator version of hyphen_check, yielding each segment of a translation
+    once it has been checked.
+    '''
+    glossary = compile_glossary(terminology)
+
     for segment in translation:
         if segment.missing_terms:
+            text = None
             for source_term in segment.missing_terms:
-                for target_term in segment.missing_terms[source_term]:
+                if source_term in segment.hyphenated_forms:
+                    continue
+                for form, variant in glossary.variant_forms.get(source_term,
+                                                                 ()):
+                    if text is None:
+                        text = normalize_target(segment.target_text)
+                    # If the variant appears in the target text
+                    if form in text:
+                        segment.add_hyphenated_form(source_term, variant)
+                        break
 
-                    # If the target_term consists of 2 or more words
-                    if len(target_term.split()) > 1:
-                        hyphenated = target_term.replace(' ', '-')
+        yield segment
 
-                        # If the hyphenated form appears in the target text
-                        if hyphenated in segment.target_text:
-                            segment.hyphenated_forms[source_term] = hyphenated
 
-    return translation
+def output_occurrences(term, segment_ids, translation):
+    '''
+    Function to output to the terminal the segments in which a term appears.
+    '''
+    print(Fore.CYAN + '\n\'' + term + '\' appears in ' +
+          str(len(segment_ids)) + ' segment(s)')
+
+    for segment_id in sorted(segment_ids):
+        segment = translation[segment_id]
+        print(Fore.CYAN + '\nSource text:')
+        print(Fore.RESET + segment.source_text)
+        print(Fore.CYAN + 'Target text:')
+        print(Fore.RESET + segment.target_text)
 
 
-def output_results(translation):
+def output_reused():
+    '''
+    Function to output to the terminal the number of segments whose checks
+    were saved by reusing the results of an identical earlier segment or of
+    the previous run.
+    '''
+    if COUNTERS['repeated_segments']:
+        print(Fore.CYAN + str(COUNTERS['repeated_segments']) +
+              ' repeated segment(s) reused the results of an identical '
+              'earlier segment.\n' + Fore.RESET)
+    if COUNTERS['reused_segments']:
+        print(Fore.CYAN + str(COUNTERS['reused_segments']) +
+              ' unchanged segment(s) reused the results of the previous '
+              'run.\n' + Fore.RESET)
+
+
+class Reporter():
+    '''
+    Used to write the segments with terminology errors found in one or more
+    translations to a file. Output is collected in a buffer and written in
+    blocks of about REPORT_BUFFER_SIZE characters (or after each segment,
+    if the file is a terminal), rather than with a write for every line.
+    Subclasses define how each segment is formatted.
+    '''
+    def __init__(self, file, close_file=False):
+        self.file = file
+        self.close_file = close_file  # whether close() closes the file
+        self.interactive = file.isatty()
+        self.buffer = []
+        self.size = 0
+        self.translation_file = None  # translation being reported
+        self.segment_num = 0  # segments reported for that translation
+
+    def start(self, translation_file):
+        '''
+        Function called before the segments of a translation are reported.
+        '''
+        self.translation_file = translation_file
+        self.segment_num = 0
+
+    def report(self, segment, findings):
+        '''
+        Function to report a segment and the Finding objects for it.
+        '''
+        self.segment_num += 1
+        self.write(self.format(segment, findings))
+        if self.interactive:
+            self.flush()
+
+    def end(self):
+        '''
+        Function called once all segments of a translation are reported.
+        '''
+        self.flush()
+
+    def format(self, segment, findings):
+        '''
+        Function to return the text written for a segment and the Finding
+        objects for it, defined by each subclass.
+        '''
+        raise NotImplementedError
+
+    def write(self, text):
+        '''
+        Function to add text to the buffer, writing the buffer to the file
+        once it holds REPORT_BUFFER_SIZE characters or more.
+        '''
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= REPORT_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        '''
+        Function to write the text in the buffer to the file.
+        '''
+        self.file.write(''.join(self.buffer))
+        self.file.flush()
+        self.buffer = []
+        self.size = 0
+
+    def close(self):
+        '''
+        Function to write any text still in the buffer, and close the file
+        if it was opened by the reporter.
+        '''
+        self.flush()
+        if self.close_file:
+            self.file.close()
+
+
+class TerminalReporter(Reporter):
+    '''
+    Used to write colored results to the terminal (or standard output).
+    '''
+    def __init__(self, file=None):
+        super().__init__(file or sys.stdout)
+
+    def format(self, segment, findings):
+        '''
+        Function to return the missing terms of a segment, with their target
+        terms and any hyphenated forms, followed by its source and target
+        text, colored for the terminal.
+        '''
+        text = []
+
+        for finding in findings:
+            text.append(Fore.RED + '\n\'' + finding.source_term +
+                        '\' should be translated as ')
+
+            # Get the number of target terms
+            target_num = len(finding.target_terms)
+            counter = 0
+
+            for target_term in finding.target_terms:
+                counter += 1
+                # Second to last element
+                if counter == target_num - 1:
+                    text.append('\'' + target_term + '\', or ')
+                # Last element
+                elif counter == target_num:
+                    text.append('\'' + target_term + '\' ')
+                # Any other element
+                else:
+                    text.append('\'' + target_term + '\', ')
+
+            # Add hyphenated form if present
+            if finding.hyphenated_form:
+                text.append(Fore.RED + '(although \'' +
+                            finding.hyphenated_form +
+                            '\' appears in the target text) ')
+
+        text.append(Fore.CYAN + '\nSource text:\n')
+        text.append(Fore.RESET + segment.source_text + '\n')
+        text.append(Fore.CYAN + 'Target text:\n')
+        text.append(Fore.RESET + segment.target_text + '\n')
+        return ''.join(text)
+
+    def end(self):
+        '''
+        Function called once all segments of a translation are reported,
+        noting if none had terminology errors.
+        '''
+        if self.segment_num == 0:
+            self.write(Fore.CYAN + '\nNo terminology errors found.\n\n')
+        self.flush()
+
+
+class JsonlReporter(Reporter):
+    '''
+    Used to write results to a JSON Lines file, one JSON object per segment
+    with terminology errors, e.g.:
+        {"translation": "translation.tmx", "segment": 12,
+         "source_text": "...", "target_text": "...",
+         "findings": [{"source_term": "...", "target_terms": ["..."],
+                       "hyphenated_form": null}]}
+    where "segment" is the position of the segment in the translation.
+    '''
+    def __init__(self, path):
+        super().__init__(open(path, 'w', encoding='utf-8'), close_file=True)
+
+    def format(self, segment, findings):
+        '''
+        Function to return the JSON object for a segment, as one line.
+        '''
+        return json.dumps({'translation': self.translation_file,
+                           'segment': segment.position,
+                           'source_text': segment.source_text,
+                           'target_text': segment.target_text,
+                           'findings': [finding.as_dict()
+                                        for finding in findings]},
+                          ensure_ascii=False) + '\n'
+
+
+class CsvReporter(Reporter):
+    '''
+    Used to write results to a CSV file, one row per missing term, with the
+    alternative target terms separated by " | ". The segment column holds
+    the position of the segment in the translation, as in JsonlReporter.
+    '''
+    def __init__(self, path):
+        super().__init__(open(path, 'w', encoding='utf-8', newline=''),
+                         close_file=True)
+        self.rows = io.StringIO()
+        self.writer = csv.writer(self.rows)
+        self.writer.writerow(['translation', 'segment', 'source_term',
+                              'target_terms', 'hyphenated_form',
+                              'source_text', 'target_text'])
+        self.write(self.take_rows())
+
+    def format(self, segment, findings):
+        '''
+        Function to return the CSV rows for the missing terms of a segment.
+        '''
+        for finding in findings:
+            self.writer.writerow([self.translation_file, segment.position,
+                                  finding.source_term,
+                                  ' | '.join(finding.target_terms),
+                                  finding.hyphenated_form or '',
+                                  segment.source_text, segment.target_text])
+        return self.take_rows()
+
+    def take_rows(self):
+        '''
+        Function to return the rows written to the CSV writer since the last
+        call, and clear them.
+        '''
+        text = self.rows.getvalue()
+        self.rows.seek(0)
+        self.rows.truncate()
+        return text
+
+
+def make_reporters(options):
     '''
-    Function to output results to the terminal.
+    Function to return the reporters selected by the command line options:
+    the terminal, and a JSON Lines and/or CSV file.
     '''
-    errors_found = False
+    reporters = [TerminalReporter()]
+    if options.get('jsonl'):
+        reporters.append(JsonlReporter(options['jsonl']))
+    if options.get('csv'):
+        reporters.append(CsvReporter(options['csv']))
+    return reporters
+
+
+def close_reporters(reporters):
+    '''
+    Function to write any output still buffered by reporters and close their
+    files.
+    '''
+    for reporter in reporters:
+        reporter.close()
+
+
+def output_results(translation, reporters=None, translation_file=None):
+    '''
+    Function to output results to the terminal, or to the given reporters.
+    '''
+    if reporters is None:
+        reporters = [TerminalReporter()]
+
+    for reporter in reporters:
+        reporter.start(translation_file)
 
     for segment in translation:
-        if segment.missing_terms:
+        findings = segment.findings()
+        if findings:
+            for reporter in reporters:
+                reporter.report(segment, findings)
 
-            errors_found = True
+    for reporter in reporters:
+        reporter.end()
 
-            for source_term in segment.missing_terms:
-                print(Fore.RED + '\n\'' + source_term +
-                      '\' should be translated as', end=' ')
 
-                # Get the number of target terms
-                target_num = len(segment.missing_terms[source_term])
-                counter = 0
+def output_profile(profile, profile_file):
+    '''
+    Function to output to the terminal the time, CPU time and peak memory
+    taken by each stage of a run and the counts of the work done, and write
+    them to a JSON file.
+    '''
+    print(Fore.CYAN + '\nProfile:' + Fore.RESET)
+    print('{:<18} {:>10} {:>10} {:>10} {:>9}'.format(
+        'stage', 'wall (s)', 'cpu (s)', 'peak (MiB)', 'items'))
+    for name, stats in sorted(profile['stages'].items(),
+                              key=lambda stage: -stage[1]['wall']):
+        print('{:<18} {:>10.3f} {:>10.3f} {:>10.1f} {:>9}'.format(
+            name, stats['wall'], stats['cpu'], stats['peak_mib'],
+            stats['items'] or ''))
+    print('{:<18} {:>10.3f} {:>10.3f} {:>10.1f}'.format(
+        'total', profile['wall'], profile['cpu'], profile['peak_mib']))
+
+    print('\n' + str(profile['segments']) + ' segment(s) at ' +
+          '{:.1f}'.format(profile['segments_per_second']) +
+          ' segment(s) per second')
+    for name, count in sorted(profile['counters'].items()):
+        print('{:<22} {:>10}'.format(name, count))
+
+    with open(profile_file, 'w', encoding='utf-8') as file:
+        json.dump(profile, file, indent=2)
+    print('\nProfile written to ' + profile_file + '\n')
+
+
+def output_coverage(matrix, coverage_file, term_num=10):
+    '''
+    Function to output to the terminal how many glossary source terms are
+    used in a translation and how consistently they are translated, listing
+    the term_num terms translated least consistently, and write the
+    statistics for every term to a tab-delimited file.
+    '''
+    stats = matrix.term_stats()
+    used = [entry for entry in stats if entry[1]]
+    occurrences = sum(entry[1] for entry in used)
+    compliant = sum(entry[2] for entry in used)
+
+    print(Fore.CYAN + '\nGlossary coverage:' + Fore.RESET)
+    print(str(len(used)) + ' of ' + str(len(stats)) + ' source terms used ' +
+          'in ' + str(matrix.segment_num) + ' segment(s), ' +
+          str(len(stats) - len(used)) + ' never used')
+    if occurrences:
+        print('{:.1f}% of '.format(100 * compliant / occurrences) +
+              str(occurrences) + ' occurrence(s) translated as in the '
+              'glossary')
+
+    # Terms with the lowest rate of correct translation, most used first
+    inconsistent = sorted((entry for entry in used if entry[2] < entry[1]),
+                          key=lambda entry: (entry[2] / entry[1], -entry[1]))
+    if inconsistent:
+        print('\nLeast consistently translated:')
+        for source_term, occurrence_num, compliant_num in \
+                inconsistent[:term_num]:
+            print('{}  {}/{} ({:.0f}%)'.format(
+                source_term, compliant_num, occurrence_num,
+                100 * compliant_num / occurrence_num))
+
+    with open(coverage_file, 'w', encoding='utf-8') as file:
+        file.write('source_term\toccurrences\tcompliant\tcompliance\n')
+        for source_term, occurrence_num, compliant_num in stats:
+            compliance = (compliant_num / occurrence_num
+                          if occurrence_num else '')
+            file.write('\t'.join([source_term, str(occurrence_num),
+                                   str(compliant_num), str(compliance)]) +
+                       '\n')
+    print('\nStatistics for every term written to ' + coverage_file + '\n')
+
+
+def prepare_glossary(glossary_file):
+    '''
+    Function to read, organize and compile the terminology in a glossary
+    file. The glossary compiled by --compile-glossary is used instead if it
+    is up to date.
+    '''
+    glossary = read_compiled_glossary(glossary_file)
+    if glossary is not None:
+        return glossary
+    return read_glossary(glossary_file)
+
+
+def read_glossary(glossary_file):
+    '''
+    Function to read, organize and compile the terminology in a glossary
+    file, ignoring any compiled glossary.
+    '''
+    return CompiledGlossary(read_terminology(glossary_file))
+
+
+def compile_main(user_input):
+    '''
+    Function to compile a glossary file and write the result next to it
+    (glossary.txt.compiled), so that later runs load it instead of reading
+    the glossary file again.
+    '''
+    if len(user_input) != 2 or not user_input[1].lower().endswith('.txt'):
+        print('\nIncorrect input.\n'
+              'Please try again using the following format.\n'
+              'python3 terminology_check.py --compile-glossary glossary.txt\n')
+        return
 
-                for target_term in segment.missing_terms[source_term]:
-                    counter += 1
-                    # Second to last element
-                    if counter == target_num - 1:
-                        print('\'' + target_term + '\'', end=', or ')
-                    # Last element
-                    elif counter == target_num:
-                        print('\'' + target_term + '\'', end=' ')
-                    # Any other element
-                    else:
-                        print('\'' + target_term + '\'', end=', ')
+    glossary = read_glossary(user_input[1])
+    write_compiled_glossary(glossary, user_input[1])
+    print('\nCompiled ' + str(len(glossary.terminology)) +
+          ' source terms to ' + user_input[1] + '.compiled\n')
 
-                # Print hyphenated form if present
 
-                if segment.hyphenated_forms:
-                    print(Fore.RED + '(although \'' +
-                          segment.hyphenated_forms[source_term] +
-                          '\' appears in the target text)', end=' ')
+def compiled_glossary_header(glossary_file):
+    '''
+    Function to return the header identifying the glossary file (by size and
+    modification time) and the versions a compiled glossary depends on.
+    Marshal data can only be read by the Python version that wrote it.
+    '''
+    stat = os.stat(glossary_file)
+    return {'version': COMPILED_GLOSSARY_VERSION,
+            'python': list(sys.version_info[:2]),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns}
+
+
+def write_compiled_glossary(glossary, glossary_file):
+    '''
+    Function to write a compiled glossary to glossary.txt.compiled. The file
+    consists of COMPILED_GLOSSARY_MAGIC, the length of a JSON header (see
+    compiled_glossary_header), the header and the state of the glossary in
+    marshal format. It is written to a temporary file first, so that an
+    interrupted run never leaves a partial file.
+    '''
+    header = json.dumps(compiled_glossary_header(glossary_file)).encode()
+    compiled_file = glossary_file + '.compiled'
+    with open(compiled_file + '.tmp', 'wb') as f:
+        f.write(COMPILED_GLOSSARY_MAGIC)
+        f.write(len(header).to_bytes(4, 'little'))
+        f.write(header)
+        marshal.dump(glossary.state(), f)
+    os.replace(compiled_file + '.tmp', compiled_file)
+
+
+def read_compiled_glossary(glossary_file):
+    '''
+    Function to load the compiled glossary written for a glossary file,
+    returning None if there is none, or if it is out of date (the glossary
+    file has changed since) or was written by another version. The file is
+    memory-mapped, so that the glossary is read straight from the page cache.
+    '''
+    compiled_file = glossary_file + '.compiled'
+    try:
+        f = open(compiled_file, 'rb')
+    except OSError:
+        return None
+
+    # An empty or truncated file cannot be mapped or loaded, and is treated
+    # in the same way as one which is out of date, as is one whose glossary
+    # file is missing (reported when the glossary file is read instead)
+    glossary = None
+    try:
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = len(COMPILED_GLOSSARY_MAGIC) + 4
+            header = None
+            if data[:len(COMPILED_GLOSSARY_MAGIC)] == COMPILED_GLOSSARY_MAGIC:
+                end = start + int.from_bytes(data[start - 4:start], 'little')
+                try:
+                    header = json.loads(data[start:end])
+                except ValueError:
+                    pass
+
+            if header == compiled_glossary_header(glossary_file):
+                # The state holds millions of containers for large
+                # glossaries, none of them garbage, so garbage collection is
+                # paused while loading it
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    with memoryview(data) as view:
+                        glossary = CompiledGlossary(None,
+                                                    marshal.loads(view[end:]))
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+    except (OSError, ValueError, EOFError, TypeError):
+        glossary = None
+
+    if glossary is None:
+        print('\nThe compiled glossary (' + compiled_file + ') is out of '
+              'date and was not used. Please run --compile-glossary '
+              'again.\n')
+        return None
+
+    COUNTERS['compiled_glossaries'] += 1
+    return glossary
+
+
+def load_nlp(glossary, glossary_file, options):
+    '''
+    Function to set up the NLP pipeline selected by the command line options
+    and attach a lemma cache to the glossary, unless disabled.
+    '''
+    nlp = setup_tokenizer(options.get('pipeline', 'full'))
+    attach_lemma_cache(glossary, glossary_file, nlp, options)
+    return nlp
 
-            print(Fore.CYAN + '\nSource text:')
-            print(Fore.RESET + segment.source_text)
-            print(Fore.CYAN + 'Target text:')
-            print(Fore.RESET + segment.target_text)
 
-    if errors_found is False:
-        print(Fore.CYAN + '\nNo terminology errors found.\n')
+def attach_lemma_cache(glossary, glossary_file, nlp, options):
+    '''
+    Function to attach to a glossary the lemma cache selected by the command
+    line options, so that lemma forms cached by previous runs are used.
+    '''
+    cache_file = options.get('lemma_cache', glossary_file + '.lemmas.sqlite')
+    if cache_file != 'off':
+        glossary.lemma_cache = LemmaCache(cache_file,
+                                          lemma_cache_key(glossary, nlp))
 
 
 def main():
     # Check user input
-    user_input = sys.argv
-    if user_input_check(user_input):
+    user_input, options = split_options(sys.argv)
+    if options.get('workers', 1) < 1:
+        print('\nThe number of worker processes (--workers=N) must be at '
+              'least 1.\n')
+
+    elif options.get('batch_size', 1) < 1:
+        print('\nThe batch size (--batch-size=N) must be at least 1.\n')
+
+    elif options.get('serve'):
+        serve_main(options)
+
+    elif options.get('compile_glossary'):
+        compile_main(user_input)
 
-        # Obtain translation
-        translation = get_translation(user_input[1])
+    elif 'shard' in options or options.get('merge'):
+        shard_main(user_input, options)
+
+    elif options.get('batch') or options.get('manifest'):
+        batch_main(user_input, options)
+
+    elif user_input_check(user_input):
+
+        # Split the translation into shards instead of checking it
+        if 'split' in options:
+            if options['split'] < 1:
+                print('\nThe number of shards (--split=N) must be at least '
+                      '1.\n')
+            else:
+                split_translation(user_input[1], user_input[2],
+                                  options['split'])
+            return
+
+        # Use a running daemon if requested, or check in this process (as
+        # always for the options which need the checks to be run here)
+        if (options.get('daemon') and
+                not any(name in options for name in LOCAL_CHECK_OPTIONS) and
+                daemon_main(user_input, options)):
+            return
+
+        if options.get('profile'):
+            PROFILER.enable()
 
         # Obtain and organize terminology
-        terminology = get_terminology(user_input[2])
-        terminology = clean_lines(terminology)
-        terminology = format_check(terminology)
-        terminology = remove_duplicates(terminology)
-        terminology = group_terminology(terminology)
-
-        # Run basic check
-        translation, missing = basic_check(terminology, translation)
-
-        # Run more advanced checks if necessary
-        if missing:
-            nlp = setup_tokenizer()
-            translation = hyphen_check(terminology, translation)
-            translation = lemma_check(nlp, terminology, translation)
-
-        # Display results
-        output_results(translation)
+        glossary = PROFILER.call('prepare_glossary', prepare_glossary,
+                                 user_input[2])
+
+        if options.get('index') or options.get('find'):
+            index_main(glossary, user_input, options)
+        else:
+            stream_main(glossary, user_input, options)
+
+        if glossary.lemma_cache is not None:
+            glossary.lemma_cache.close()
+
+        if options.get('profile'):
+            profile_file = options['profile']
+            if profile_file is True:
+                profile_file = user_input[1] + '.profile.json'
+            output_profile(PROFILER.report(), profile_file)
+
+
+def stream_main(glossary, user_input, options):
+    '''
+    Function to check a translation one segment at a time, only keeping the
+    segments with missing terminology.
+    '''
+    matrix = None
+    if options.get('coverage'):
+        matrix = OccurrenceMatrix(glossary)
+
+    translation = stream_checks(glossary, user_input[1], options,
+                                lambda: PROFILER.call('load_nlp', load_nlp,
+                                                      glossary, user_input[2],
+                                                      options),
+                                matrix)
+
+    # Display results as the checks complete
+    reporters = make_reporters(options)
+    PROFILER.call('output_results', output_results, translation, reporters,
+                  user_input[1])
+    close_reporters(reporters)
+    output_reused()
+
+    if matrix is not None:
+        coverage_file = options['coverage']
+        if coverage_file is True:
+            coverage_file = user_input[1] + '.coverage.txt'
+        output_coverage(matrix, coverage_file)
+
+
+def stream_checks(glossary, translation_file, options, get_nlp,
+                  matrix=None):
+    '''
+    Function to run every check on a translation one segment at a time,
+    yielding the segments in which the basic check found missing
+    terminology once they have been through the remaining checks.
+    get_nlp is called to obtain the NLP pipeline, only if it is needed.
+    The source terms occurring in each segment are recorded in matrix, if
+    an OccurrenceMatrix is given.
+    '''
+    # Obtain translation one segment at a time, marking repetitions. With
+    # --mmap, the basic check is run on the segments as they are read.
+    repeats = Repeats()
+    if options.get('mmap'):
+        translation = PROFILER.stage('read_mapped', iter_mapped_checks(
+            translation_file, glossary, options.get('workers', 1),
+            options.get('incremental') or matrix is not None, repeats))
+    else:
+        translation = PROFILER.stage('read_translation',
+                                     iter_translation(translation_file))
+    translation = PROFILER.stage('find_repeats', repeats.mark(translation))
+
+    # Reuse the results of unchanged segments from the previous run
+    store = None
+    if options.get('incremental'):
+        store = FingerprintStore(translation_file + '.termcheck.json',
+                                 glossary, fingerprint_store_key(options))
+        translation = PROFILER.stage('reuse_results',
+                                     store.reuse(translation))
+
+    # Run the basic check, which also finds hyphenated forms. Segments
+    # without missing terminology need no further checks and are not kept.
+    if options.get('mmap'):
+        translation = PROFILER.stage('clear_repeats',
+                                     clear_repeats(translation))
+    else:
+        translation = PROFILER.stage('basic_check',
+                                     stream_basic_check(glossary, translation))
+    if store is not None:
+        translation = PROFILER.stage('record_results',
+                                     store.record(translation))
+    if matrix is not None:
+        translation = PROFILER.stage('record_occurrences',
+                                     matrix.record(translation))
+    translation = PROFILER.stage('forget_clean',
+                                 repeats.forget_clean(translation))
+    translation = (segment for segment in translation
+                   if needs_checking(segment))
+
+    # Run more advanced checks if necessary, i.e. once a segment which has
+    # not reused earlier results is found to have missing terminology
+    reused_segments = []
+    for segment in translation:
+        reused_segments.append(segment)
+        if segment.missing_terms:
+            break
+    translation = itertools.chain(reused_segments, translation)
+
+    if reused_segments and reused_segments[-1].missing_terms:
+        nlp = get_nlp()
+        translation = PROFILER.stage('lemma_check', stream_lemma_check(
+            nlp, glossary, translation, options.get('batch_size'),
+            options.get('workers', 1)))
+
+        # Release the segments whose missing terms the lemma check found
+        translation = PROFILER.stage('forget_resolved',
+                                     repeats.forget_clean(translation))
+
+    if store is not None:
+        translation = PROFILER.stage('update_results',
+                                     store.update(translation))
+
+    translation = PROFILER.stage('copy_repeats', copy_repeats(translation))
+    if matrix is not None:
+        translation = PROFILER.stage('resolve_occurrences',
+                                     matrix.resolve(translation))
+
+    yield from translation
+
+    if store is not None:
+        store.save()
+
+
+def index_main(glossary, user_input, options):
+    '''
+    Function to check a whole translation against an index of its target
+    text, and answer a --find query using the same index.
+    '''
+    translation = PROFILER.stage('read_translation',
+                                 iter_translation(user_input[1]))
+    translation = list(PROFILER.stage('find_repeats',
+                                      find_repeats(translation)))
+    translation, missing = PROFILER.call('basic_check', basic_check,
+                                         glossary, translation)
+
+    # Run more advanced checks if necessary
+    if missing or options.get('find'):
+        nlp = PROFILER.call('load_nlp', load_nlp,
+                            glossary, user_input[2], options)
+        translation, index = PROFILER.call(
+            'index_check', index_check, nlp, glossary, translation,
+            options.get('batch_size'), options.get('workers', 1))
+
+    if options.get('find'):
+        term = options['find']
+        output_occurrences(term, index.find(get_lemma(term, nlp)),
+                           translation)
+    else:
+        reporters = make_reporters(options)
+        PROFILER.call('output_results', output_results,
+                      copy_repeats(translation), reporters, user_input[1])
+        close_reporters(reporters)
+        output_reused()
+
+
+def batch_main(user_input, options):
+    '''
+    Function to check several translations in one run, each against its
+    own glossary. The NLP pipeline is loaded once and each distinct
+    glossary is prepared once, however many translations use it, and the
+    translations are then checked across a pool of --workers processes
+    (which inherit the pipeline and glossaries where the platform allows).
+    '''
+    jobs = batch_jobs(user_input, options.get('manifest'))
+    if jobs is None:
+        return
+
+    glossary_files = list(dict.fromkeys(job[1] for job in jobs))
+    prepare_batch(glossary_files, options)
+    prepared = Counter(COUNTERS)
+
+    reporters = make_reporters(options)
+    workers = min(options.get('workers', 1), len(jobs))
+    if workers > 1:
+        with process_pool(workers, init_batch_worker,
+                          (glossary_files, options)) as pool:
+            totals = output_batch_results(pool.imap(check_job, jobs),
+                                          reporters)
+    else:
+        totals = output_batch_results(map(check_job, jobs), reporters)
+    close_reporters(reporters)
+
+    COUNTERS.clear()
+    COUNTERS.update(prepared + totals)
+
+
+def batch_jobs(user_input, manifest_file=None):
+    '''
+    Function to list the (translation file, glossary file) pairs to check in
+    a batch run, from a manifest file and/or the arguments entered at the
+    command line, i.e. one or more translations (tmx files, directories
+    containing tmx files, or glob patterns) followed by the glossary to
+    check them against. Returns None if the input is not valid.
+    '''
+    jobs = []
+    if manifest_file is not None:
+        jobs = read_manifest(manifest_file)
+        if jobs is None:
+            return None
+
+    arguments = user_input[1:]
+    if arguments or not jobs:
+        if (len(arguments) < 2 or
+                not arguments[-1].lower().endswith('.txt')):
+            print('\nIncorrect input.\n'
+                  'Please try again using the following format.\n'
+                  'python3 terminology_check.py --batch translation.tmx... '
+                  'glossary.txt\n'
+                  '(translations may also be directories or glob patterns)\n'
+                  'or\n'
+                  'python3 terminology_check.py --manifest=manifest.txt\n')
+            return None
+
+        glossary_file = arguments[-1]
+        for pattern in arguments[:-1]:
+            translation_files = expand_translations(pattern)
+            if not translation_files:
+                print('\nNo tmx files found for ' + pattern + '\n')
+                return None
+            jobs += [(translation_file, glossary_file)
+                     for translation_file in translation_files]
+
+    # Check that every file exists before any checks are started
+    missing = [path for path in dict.fromkeys(itertools.chain(*jobs))
+               if not os.path.isfile(path)]
+    if missing:
+        print('\nFile(s) not found:\n' + '\n'.join(missing) + '\n')
+        return None
+
+    return jobs
+
+
+def expand_translations(pattern):
+    '''
+    Function to return the tmx files matching a batch run argument, which
+    may be a tmx file, a directory (searched recursively) or a glob pattern.
+    '''
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '**', '*.tmx')
+    return sorted(path for path in glob.glob(pattern, recursive=True)
+                  if path.lower().endswith('.tmx'))
+
+
+def read_manifest(manifest_file):
+    '''
+    Function to read a manifest file listing the translations to check in a
+    batch run, one per line together with its glossary, separated by a tab:
+        translation.tmx<tab>glossary.txt
+    Blank lines and lines starting with # are ignored, and relative paths
+    are taken to be relative to the manifest file. Returns None if any line
+    is not in this format.
+    '''
+    try:
+        with open(manifest_file, encoding='utf-8') as file:
+            lines = file.readlines()
+    except FileNotFoundError as fnf_error:
+        print(fnf_error)
+        return None
+
+    base = os.path.dirname(manifest_file)
+    jobs = []
+    errors = []
+
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = [field.strip() for field in line.split('\t')]
+        if (len(fields) != 2 or not fields[0].lower().endswith('.tmx') or
+                not fields[1].lower().endswith('.txt')):
+            errors.append(str(line_num))
+            continue
+        jobs.append((os.path.join(base, fields[0]),
+                     os.path.join(base, fields[1])))
+
+    if errors:
+        print('\nThe following lines in the manifest are not in the format '
+              'translation.tmx<tab>glossary.txt: ' + ', '.join(errors) + '\n')
+        return None
+
+    return jobs
+
+
+def prepare_batch(glossary_files, options):
+    '''
+    Function to set up the NLP pipeline and glossaries shared by the jobs of
+    a batch run. The lemma forms of all target terms are worked out here
+    (using the lemma cache of each glossary), so that the jobs never need
+    to open a lemma cache themselves.
+    '''
+    nlp = setup_tokenizer(options.get('pipeline', 'full'))
+    glossaries = {glossary_file: prepare_batch_glossary(glossary_file, nlp,
+                                                        options)
+                  for glossary_file in glossary_files}
+
+    # Each job lemmatizes its translation in a single process
+    BATCH.update(nlp=nlp, glossaries=glossaries,
+                 options=dict(options, workers=1))
+
+
+def prepare_batch_glossary(glossary_file, nlp, options):
+    '''
+    Function to prepare a glossary for batch jobs, including the lemma forms
+    of all its target terms, which are parsed together (see
+    CompiledGlossary.lemmatize).
+    '''
+    glossary = prepare_glossary(glossary_file)
+    attach_lemma_cache(glossary, glossary_file, nlp, options)
+    glossary.lemmatize((target_term
+                        for target_terms in glossary.terminology.values()
+                        for target_term in target_terms),
+                       nlp, options.get('batch_size'))
+    if glossary.lemma_cache is not None:
+        glossary.lemma_cache.close()
+        glossary.lemma_cache = None
+    return glossary
+
+
+def process_pool(workers, initializer, initargs):
+    '''
+    Function to return a pool of worker processes, each running initializer
+    with initargs when it starts. Workers are forked where the platform
+    allows, so that they inherit the state of this process (e.g. the NLP
+    pipeline and glossaries) rather than setting it up again.
+    '''
+    import multiprocessing
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    return context.Pool(workers, initializer, initargs)
+
+
+def init_batch_worker(glossary_files, options):
+    '''
+    Function run when each worker process of a batch run starts, to set up
+    the NLP pipeline and glossaries unless they were inherited from the main
+    process.
+    '''
+    if not BATCH:
+        prepare_batch(glossary_files, options)
+
+
+def check_job(job):
+    '''
+    Function to check one (translation file, glossary file) pair of a batch
+    run. Returns the job, the source text, target text, missing terms,
+    hyphenated forms and position of each segment with terminology errors,
+    and the counts of the work done.
+    '''
+    translation_file, glossary_file = job
+    COUNTERS.clear()
+
+    results = []
+    for segment in stream_checks(BATCH['glossaries'][glossary_file],
+                                 translation_file, BATCH['options'],
+                                 lambda: BATCH['nlp']):
+        if segment.findings():
+            results.append((segment.source_text, segment.target_text,
+                            dict(segment.missing_terms),
+                            dict(segment.hyphenated_forms),
+                            segment.position))
+
+    return job, results, Counter(COUNTERS)
+
+
+def output_batch_results(results, reporters=None):
+    '''
+    Function to output the results of each job of a batch run to the
+    terminal (or the given reporters) as the jobs complete, followed by a
+    summary of the translations with terminology errors. Returns the
+    combined counts of the work done.
+    '''
+    totals = Counter()
+    error_nums = {}  # {translation file: number of segments with errors}
+
+    for (translation_file, glossary_file), segments, counters in results:
+        print(Fore.CYAN + '\n' + translation_file + ' (' + glossary_file +
+              ')' + Fore.RESET)
+        output_results((Segment(*segment) for segment in segments),
+                       reporters, translation_file)
+
+        # Report the segments reused by this job only
+        COUNTERS.clear()
+        COUNTERS.update(counters)
+        output_reused()
+
+        totals.update(counters)
+        error_nums[translation_file] = len(segments)
+
+    print(Fore.CYAN + '\n' + str(len(error_nums)) + ' translation(s) '
+          'checked, ' + str(sum(1 for x in error_nums.values() if x)) +
+          ' with terminology errors.' + Fore.RESET)
+    for translation_file, error_num in error_nums.items():
+        if error_num:
+            print(translation_file + ': ' + str(error_num) +
+                  ' segment(s) with terminology errors')
+
+    return totals
+
+
+def serve_main(options):
+    '''
+    Function to run as a daemon which keeps the NLP pipeline and glossaries
+    in memory and checks translations on request (see
+    CheckRequestHandler), until interrupted with Ctrl+C.
+    '''
+    server = make_daemon(options, options.get('port', DAEMON_PORT))
+    print(Fore.CYAN + '\nListening for check requests on ' +
+          'http://127.0.0.1:' + str(server.server_address[1]) +
+          '/check (press Ctrl+C to stop).\n' + Fore.RESET)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def make_daemon(options, port):
+    '''
+    Function to load the NLP pipeline and return an HTTP server accepting
+    check requests on a local port (0 for any free port).
+    '''
+    import http.server
+
+    class CheckRequestHandler(http.server.BaseHTTPRequestHandler):
+        do_POST = answer_check_request
+
+    prepare_batch([], options)
+    BATCH['modified'] = {}  # {glossary file: time last modified}
+    return http.server.HTTPServer(('127.0.0.1', port), CheckRequestHandler)
+
+
+def answer_check_request(handler):
+    '''
+    Function used by the daemon to answer check requests, i.e. POST requests
+    to /check with a JSON body of the form:
+        {"translation": "/path/translation.tmx",
+         "glossary": "/path/glossary.txt"}
+    The reply is a JSON object holding the segments with terminology errors
+    and the counts of the work done, as returned by check_job. Requests are
+    answered one at a time, so the NLP pipeline is never used by two checks
+    at once.
+    '''
+    if handler.path != '/check':
+        handler.send_error(404)
+        return
+
+    try:
+        length = int(handler.headers.get('Content-Length', 0))
+        request = json.loads(handler.rfile.read(length))
+        job = (request['translation'], request['glossary'])
+    except (ValueError, KeyError, TypeError):
+        handler.send_error(400, 'Expected translation and glossary paths')
+        return
+
+    missing = [path for path in job if not os.path.isfile(path)]
+    if missing:
+        handler.send_error(404, 'File(s) not found: ' + ', '.join(missing))
+        return
+
+    refresh_glossary(job[1])
+    _, results, counters = check_job(job)
+
+    body = json.dumps({'results': results, 'counters': counters},
+                      ensure_ascii=False).encode()
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'application/json; charset=utf-8')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def refresh_glossary(glossary_file):
+    '''
+    Function to prepare a glossary for the daemon the first time it is used,
+    and again whenever the file has been modified since.
+    '''
+    modified = os.path.getmtime(glossary_file)
+    if BATCH['modified'].get(glossary_file) != modified:
+        BATCH['glossaries'][glossary_file] = prepare_batch_glossary(
+            glossary_file, BATCH['nlp'], BATCH['options'])
+        BATCH['modified'][glossary_file] = modified
+
+
+def request_check(translation_file, glossary_file, port=DAEMON_PORT):
+    '''
+    Function to ask the daemon listening on a local port to check a
+    translation. Returns the segments with terminology errors (as returned
+    by check_job) and the counts of the work done, or None if no daemon is
+    running or it could not check the translation.
+    '''
+    import urllib.error
+    import urllib.request
+
+    body = json.dumps({'translation': os.path.abspath(translation_file),
+                       'glossary': os.path.abspath(glossary_file)}).encode()
+    request = urllib.request.Request(
+        'http://127.0.0.1:' + str(port) + '/check', data=body,
+        headers={'Content-Type': 'application/json'})
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            reply = json.load(response)
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+    return reply['results'], Counter(reply['counters'])
+
+
+def daemon_main(user_input, options):
+    '''
+    Function to check a translation using a running daemon and output the
+    results to the reporters selected by the command line options. Returns
+    False if no daemon is running, so that the translation can be checked
+    in this process instead.
+    '''
+    reply = request_check(user_input[1], user_input[2],
+                          options.get('port', DAEMON_PORT))
+    if reply is None:
+        return False
+
+    segments, counters = reply
+    reporters = make_reporters(options)
+    output_results((Segment(*segment) for segment in segments), reporters,
+                   user_input[1])
+    close_reporters(reporters)
+    COUNTERS.update(counters)
+    output_reused()
+    return True
+
+
+def split_translation(translation_file, glossary_file, shard_num):
+    '''
+    Function to split a tmx file into shard_num tmx files (shards) holding
+    consecutive translation units, and write a manifest listing the shards,
+    the glossary, and the file to which the results of checking each shard
+    are to be written. Paths in the manifest are relative to it, so that
+    the directory holding the shards can be copied to other machines.
+    '''
+    directory = os.path.dirname(os.path.abspath(translation_file))
+    name = os.path.basename(translation_file)[:-len('.tmx')]
+
+    # First pass: count the translation units
+    try:
+        file = open(translation_file, 'rb')
+    except FileNotFoundError as fnf_error:
+        print(fnf_error)
+        sys.exit()
+
+    with file:
+        tu_num = 0
+        for _, element in ElementTree.iterparse(file):
+            if element.tag == 'tu':
+                tu_num += 1
+                element.clear()
+
+    if tu_num == 0:
+        print('\nThere are no segments in ' + translation_file + ' to '
+              'split.\n')
+        return
+
+    shard_num = min(shard_num, tu_num)
+    shards = []
+    for shard in range(shard_num):
+        first = tu_num * shard // shard_num
+        last = tu_num * (shard + 1) // shard_num
+        shard_name = '{}.shard-{}-of-{}'.format(name, shard + 1, shard_num)
+        shards.append({'file': shard_name + '.tmx',
+                       'results': shard_name + '.results.jsonl',
+                       'first_segment': first,
+                       'segment_num': last - first})
+
+    # Second pass: copy the translation units to the shards in turn
+    try:
+        file = open(translation_file, 'rb')
+    except FileNotFoundError as fnf_error:
+        print(fnf_error)
+        sys.exit()
+
+    with file:
+        root = None  # tmx element
+        namespaces = []  # (prefix, uri) pairs declared on the tmx element
+        header = ''
+        parent = None  # element containing the tu elements (i.e. body)
+        shard = -1
+        shard_file = None
+        position = 0
+
+        for event, element in ElementTree.iterparse(
+                file, events=('start-ns', 'start', 'end')):
+            if event == 'start-ns':
+                if root is None:
+                    namespaces.append(element)
+                continue
+            if event == 'start':
+                if root is None:
+                    root = element
+                elif element.tag == 'body':
+                    parent = element
+                continue
+
+            if element.tag == 'header':
+                header = ElementTree.tostring(element, encoding='unicode')
+
+            elif element.tag == 'tu':
+                while (shard < 0 or
+                       position == shards[shard]['first_segment'] +
+                       shards[shard]['segment_num']):
+                    if shard_file is not None:
+                        shard_file.write(('</body>\n</' + root_tag +
+                                          '>\n').encode())
+                        shard_file.close()
+                    shard += 1
+                    shard_file = open(os.path.join(directory,
+                                                   shards[shard]['file']),
+                                      'wb')
+                    root_tag, start_tag = xml_start_tag(root, namespaces)
+                    shard_file.write(
+                        ('<?xml version="1.0" encoding="UTF-8"?>\n' +
+                         start_tag + '\n' + header + '<body>\n').encode())
+
+                element.tail = '\n'
+                shard_file.write(ElementTree.tostring(
+                    element, encoding='unicode').encode())
+                position += 1
+
+                # Discard the translation unit now it has been copied
+                element.clear()
+                if parent is not None:
+                    parent.clear()
+
+        if shard_file is not None:
+            shard_file.write(('</body>\n</' + root_tag + '>\n').encode())
+            shard_file.close()
+
+    manifest_file = translation_file + '.shards.json'
+    with open(manifest_file, 'w', encoding='utf-8') as file:
+        json.dump({'version': SHARD_MANIFEST_VERSION,
+                   'translation': name + '.tmx',
+                   'glossary': os.path.relpath(os.path.abspath(glossary_file),
+                                               directory),
+                   'segment_num': tu_num,
+                   'shards': shards},
+                  file, ensure_ascii=False, indent=2)
+
+    print(Fore.CYAN + '\n' + str(tu_num) + ' segment(s) split into ' +
+          str(len(shards)) + ' shard(s). To check each shard:' + Fore.RESET)
+    for shard in range(len(shards)):
+        print('python3 term_checker.py --shard=' + str(shard + 1) + ' ' +
+              manifest_file)
+    print(Fore.CYAN + 'Then, to report the results of all shards:' +
+          Fore.RESET)
+    print('python3 term_checker.py --merge ' + manifest_file + '\n')
+
+
+
+def xml_start_tag(element, namespaces):
+    '''
+    Function to return the name and start tag of an element parsed with
+    ElementTree, declaring the given namespaces ((prefix, uri) pairs, as
+    reported by iterparse) and writing the names of the element and its
+    attributes with their prefixes rather than as {uri}name.
+    '''
+    prefixes = {XML_NAMESPACE: 'xml'}
+    prefixes.update((uri, prefix) for prefix, uri in namespaces)
+
+    def prefixed(name):
+        '''
+        Function to return a name as prefix:name (or name, for the default
+        namespace or no namespace) rather than as {uri}name.
+        '''
+        if name[0] != '{':
+            return name
+        uri, _, local_name = name[1:].partition('}')
+        return prefixes[uri] + ':' + local_name if prefixes[uri] else \
+            local_name
+
+    attributes = [('xmlns:' + prefix if prefix else 'xmlns', uri)
+                  for prefix, uri in namespaces]
+    attributes += [(prefixed(name), value)
+                   for name, value in element.attrib.items()]
+    tag = prefixed(element.tag)
+    return tag, '<' + tag + ''.join(' ' + name + '=' + quoteattr(value)
+                                    for name, value in attributes) + '>'
+
+
+def read_shard_manifest(manifest_file):
+    '''
+    Function to read a manifest written by split_translation, returning it
+    with the paths it holds made relative to the current directory, or None
+    if it cannot be read.
+    '''
+    try:
+        with open(manifest_file, encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError) as error:
+        print('\nCould not read the shard manifest: ' + str(error) + '\n')
+        return None
+
+    if manifest.get('version') != SHARD_MANIFEST_VERSION:
+        print('\nThe shard manifest was written by a different version of '
+              'this script. Please split the translation again.\n')
+        return None
+
+    directory = os.path.dirname(manifest_file)
+    manifest['translation'] = os.path.join(directory,
+                                           manifest['translation'])
+    manifest['glossary'] = os.path.join(directory, manifest['glossary'])
+    for shard in manifest['shards']:
+        shard['file'] = os.path.join(directory, shard['file'])
+        shard['results'] = os.path.join(directory, shard['results'])
+    return manifest
+
+
+def shard_main(user_input, options):
+    '''
+    Function to check one shard listed in a shard manifest (--shard=N),
+    writing the results to the file given in the manifest, or to report the
+    results of all shards in the order of the original translation
+    (--merge).
+    '''
+    if len(user_input) != 2 or not user_input[1].lower().endswith('.json'):
+        print('\nIncorrect input.\n'
+              'Please try again using the following format.\n'
+              'python3 terminology_check.py --shard=N translation.tmx.'
+              'shards.json\n'
+              'or\n'
+              'python3 terminology_check.py --merge translation.tmx.'
+              'shards.json\n')
+        return
+
+    manifest = read_shard_manifest(user_input[1])
+    if manifest is None:
+        return
+
+    if options.get('merge'):
+        merge_shards(manifest, options)
+    elif 1 <= options['shard'] <= len(manifest['shards']):
+        check_shard(manifest, manifest['shards'][options['shard'] - 1],
+                    options)
+    else:
+        print('\nThe shard number (--shard=N) must be from 1 to ' +
+              str(len(manifest['shards'])) + ', the number of shards in the '
+              'manifest.\n')
+
+
+def check_shard(manifest, shard, options):
+    '''
+    Function to check a shard, writing the segments with terminology errors
+    to its results file in the format of JsonlReporter, with their positions
+    in the original translation. The file is only created once the whole
+    shard has been checked.
+    '''
+    glossary = prepare_glossary(manifest['glossary'])
+    translation = stream_checks(glossary, shard['file'], options,
+                                lambda: load_nlp(glossary,
+                                                 manifest['glossary'],
+                                                 options))
+
+    temporary_file = shard['results'] + '.tmp'
+    reporter = JsonlReporter(temporary_file)
+    reporter.start(os.path.basename(manifest['translation']))
+    for segment in translation:
+        findings = segment.findings()
+        if findings:
+            segment.position += shard['first_segment']
+            reporter.report(segment, findings)
+    reporter.end()
+    reporter.close()
+    os.replace(temporary_file, shard['results'])
+
+    if glossary.lemma_cache is not None:
+        glossary.lemma_cache.close()
+
+    print(Fore.CYAN + '\n' + os.path.basename(shard['file']) + ': ' +
+          str(reporter.segment_num) + ' segment(s) with terminology errors, '
+          'written to ' + shard['results'] + '\n' + Fore.RESET)
+
+
+def merge_shards(manifest, options):
+    '''
+    Function to report the results of every shard listed in a manifest, in
+    the order of the original translation, once all shards are checked.
+    '''
+    missing = [str(shard_num) for shard_num, shard
+               in enumerate(manifest['shards'], 1)
+               if not os.path.isfile(shard['results'])]
+    if missing:
+        print('\nThe following shards have not been checked yet: ' +
+              ', '.join(missing) + '\n')
+        return
+
+    reporters = make_reporters(options)
+    output_results(iter_shard_results(manifest), reporters,
+                   manifest['translation'])
+    close_reporters(reporters)
+
+
+def iter_shard_results(manifest):
+    '''
+    Function to yield, in the order of the original translation, a segment
+    for each result in the results files of the shards listed in a manifest.
+    '''
+    for shard in manifest['shards']:
+        with open(shard['results'], encoding='utf-8') as file:
+            for line in file:
+                result = json.loads(line)
+                findings = result['findings']
+                yield Segment(result['source_text'], result['target_text'],
+                              {finding['source_term']: finding['target_terms']
+                               for finding in findings},
+                              {finding['source_term']:
+                               finding['hyphenated_form']
+                               for finding in findings
+                               if finding['hyphenated_form']},
+                              result['segment'])
 
 
 if __name__ == "__main__":
@@ -1,8 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import csv
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
 import pytest
 import spacy
+from colorama import Fore
 from spacy.tokenizer import Tokenizer
 from spacy.util import compile_infix_regex
 
@@ -27,6 +39,23 @@ def test_constructor():
     assert isinstance(s, Segment)
 
 
+# Testing that segments are compact and record findings only when needed
+def test_segment_findings():
+    s1 = Segment('装置', 'The device.')
+    s2 = Segment('印刷装置', 'A printing-device.')
+    assert not hasattr(s1, '__dict__')
+    assert s1.missing_terms is s2.missing_terms is term_checker.NO_FINDINGS
+    assert s1.findings() == []
+
+    s2.add_missing_term('印刷装置', ['printing device'])
+    s2.add_hyphenated_form('印刷装置', 'printing-device')
+    assert s1.missing_terms == {}
+    assert s2.missing_terms == {'印刷装置': ['printing device']}
+    assert s2.findings() == [term_checker.Finding('印刷装置',
+                                                  ['printing device'],
+                                                  'printing-device')]
+
+
 # Test for the user input check
 @pytest.mark.parametrize('user_input,expected', [
                           (['term_checker.py', 'file.tmx', 'file.txt'], True),
@@ -40,6 +69,23 @@ def test_user_input_check(user_input, expected):
     assert term_checker.user_input_check(user_input) == expected
 
 
+# Testing separating command line options from the other arguments
+@pytest.mark.parametrize('user_input,expected', [
+                          (['term_checker.py', 'file.tmx', 'file.txt'],
+                           (['term_checker.py', 'file.tmx', 'file.txt'], {})),
+                          (['term_checker.py', '--workers=4', 'file.tmx', 'file.txt'],
+                           (['term_checker.py', 'file.tmx', 'file.txt'], {'workers': 4})),
+                          (['term_checker.py', 'file.tmx', 'file.txt', '--batch-size=50'],
+                           (['term_checker.py', 'file.tmx', 'file.txt'], {'batch_size': 50})),
+                          (['term_checker.py', 'file.tmx', 'file.txt', '--workers=x'],
+                           (['term_checker.py', 'file.tmx', 'file.txt', '--workers=x'], {})),
+                          (['term_checker.py', 'file.tmx', 'file.txt', '--unknown=1'],
+                           (['term_checker.py', 'file.tmx', 'file.txt', '--unknown=1'], {}))
+                          ])
+def test_split_options(user_input, expected):
+    assert term_checker.split_options(user_input) == expected
+
+
 # Testing obtaining terminology from the glossary file
 def test_get_terminology():
 
@@ -194,6 +240,37 @@ def test_group_terminology():
     assert output == expected
 
 
+# Testing reading and grouping terminology in a single pass
+def test_read_terminology(tmp_path, capsys):
+
+    for glossary_file in [GLOSSARY_FILE_1, GLOSSARY_FILE_2]:
+        terminology = term_checker.get_terminology(glossary_file)
+        terminology = term_checker.clean_lines(terminology)
+        terminology = term_checker.format_check(terminology)
+        terminology = term_checker.remove_duplicates(terminology)
+        expected = term_checker.group_terminology(terminology)
+
+        output = term_checker.read_terminology(glossary_file)
+        assert output == expected
+        assert list(output) == list(expected)
+
+    # Malformed lines are reported with their line numbers, blank lines not
+    glossary_file = tmp_path / 'glossary.txt'
+    glossary_file.write_text('装置\tdevice\n\n装置 device\n装置\tdevice\n' +
+                             '特許\tpatent\tpatent\n' * 11,
+                             encoding='utf-8')
+    capsys.readouterr()
+    term_checker.COUNTERS.clear()
+    assert term_checker.read_terminology(str(glossary_file)) == \
+        {'装置': ['device']}
+    output = capsys.readouterr().out
+    assert 'Line 3 of ' in output and '装置 device' in output
+    assert 'Line 2 of ' not in output
+    assert 'Line 14 of ' not in output
+    assert '2 more lines of ' in output
+    assert term_checker.COUNTERS['malformed_glossary_lines'] == 12
+
+
 # Testing obtaining translation segments from a tmx file
 def test_get_translation():
 
@@ -221,6 +298,304 @@ def test_get_translation():
     assert output == expected
 
 
+# Testing finding source terms with the Aho-Corasick scanner
+@pytest.mark.parametrize('text,expected', [
+                          ('情報処理装置を備える', ['装置', '情報処理装置', '処理']),
+                          ('処理装置', ['装置', '処理']),
+                          ('断面模式図と平面模式図', ['断面模式図', '平面模式図', '模式図']),
+                          ('模式', []),
+                          ('', [])
+                          ])
+def test_term_scanner(text, expected):
+    terms = ['装置', '情報処理装置', '断面模式図', '平面模式図', '模式図', '処理']
+    scanner = term_checker.TermScanner(terms)
+    assert scanner.scan(text) == expected
+    assert scanner.scan(text) == [term for term in terms if term in text]
+
+
+# Testing the forms precomputed by the compiled glossary
+def test_compiled_glossary():
+
+    terminology = {'技術分野': ['Technical Field'],
+                   '装置': ['device', 'apparatus'],
+                   '印刷装置': ['printing devices']}
+
+    glossary = term_checker.CompiledGlossary(terminology)
+
+    assert glossary.terminology is terminology
+    assert glossary.normalized_forms == {'技術分野': ['technical field'],
+                                         '装置': ['device', 'apparatus'],
+                                         '印刷装置': ['printing devices']}
+    assert glossary.variant_forms == {
+        '技術分野': [('technical-field', 'Technical-Field'),
+                   ('technicalfield', 'TechnicalField')],
+        '装置': [],
+        '印刷装置': [('printing-devices', 'printing-devices'),
+                 ('printingdevices', 'printingdevices')]}
+    assert glossary.lemma('printing devices', nlp) == 'printing device'
+    assert glossary.lemma_forms == {'printing devices': 'printing device'}
+    assert term_checker.compile_glossary(glossary) is glossary
+
+
+# Testing loading a glossary compiled by --compile-glossary
+def test_compiled_glossary_file(tmp_path, capsys):
+
+    glossary_file = str(tmp_path / 'glossary.txt')
+    shutil.copy(GLOSSARY_FILE_1, glossary_file)
+    expected = term_checker.read_glossary(glossary_file)
+
+    # Without a compiled glossary, the glossary file is read
+    assert term_checker.read_compiled_glossary(glossary_file) is None
+
+    term_checker.compile_main(['term_checker.py', glossary_file])
+    assert os.path.exists(glossary_file + '.compiled')
+
+    term_checker.COUNTERS.clear()
+    glossary = term_checker.prepare_glossary(glossary_file)
+    assert term_checker.COUNTERS['compiled_glossaries'] == 1
+    assert glossary.state() == expected.state()
+    assert glossary.lemma_forms == {} and glossary.lemma_cache is None
+    assert glossary.scanner.scan('技術分野') == \
+        expected.scanner.scan('技術分野')
+
+    # Once the glossary file changes, it is read again
+    with open(glossary_file, 'a', encoding='utf-8') as f:
+        f.write('\n印刷装置\tprinting device\n')
+    capsys.readouterr()
+    term_checker.COUNTERS.clear()
+    glossary = term_checker.prepare_glossary(glossary_file)
+    assert term_checker.COUNTERS['compiled_glossaries'] == 0
+    assert glossary.terminology['印刷装置'] == ['printing device']
+    assert 'out of date' in capsys.readouterr().out
+
+    # As is a file which is not a compiled glossary
+    with open(glossary_file + '.compiled', 'wb') as f:
+        f.write(b'not a compiled glossary')
+    assert term_checker.read_compiled_glossary(glossary_file) is None
+
+    # And an empty or truncated one
+    term_checker.compile_main(['term_checker.py', glossary_file])
+    with open(glossary_file + '.compiled', 'rb') as f:
+        compiled = f.read()
+    for data in [b'', compiled[:-10]]:
+        with open(glossary_file + '.compiled', 'wb') as f:
+            f.write(data)
+        capsys.readouterr()
+        assert term_checker.read_compiled_glossary(glossary_file) is None
+        assert 'out of date' in capsys.readouterr().out
+
+    # And one whose glossary file is missing, which is then reported
+    term_checker.compile_main(['term_checker.py', glossary_file])
+    os.remove(glossary_file)
+    assert term_checker.read_compiled_glossary(glossary_file) is None
+    with pytest.raises(SystemExit):
+        term_checker.prepare_glossary(glossary_file)
+    assert 'No such file' in capsys.readouterr().out
+
+
+# Testing keeping lemma forms of target terms between runs
+def test_lemma_cache(tmp_path):
+
+    path = str(tmp_path / 'glossary.txt.lemmas.sqlite')
+    glossary = term_checker.CompiledGlossary({'装置': ['devices'],
+                                              '印刷装置': ['printing devices']})
+    key = term_checker.lemma_cache_key(glossary, nlp)
+
+    # First run lemmatizes the terms and stores them
+    glossary.lemma_cache = term_checker.LemmaCache(path, key)
+    assert glossary.lemma('devices', nlp) == 'device'
+    assert glossary.lemma('printing devices', nlp) == 'printing device'
+    glossary.lemma_cache.close()
+
+    # Second run takes them from the cache without running the pipeline
+    term_checker.COUNTERS.clear()
+    glossary = term_checker.CompiledGlossary(glossary.terminology)
+    glossary.lemma_cache = term_checker.LemmaCache(path, key)
+    assert glossary.lemma('devices', nlp) == 'device'
+    assert glossary.lemma('printing devices', nlp) == 'printing device'
+    glossary.lemma_cache.close()
+    assert term_checker.COUNTERS['term_parses'] == 0
+    assert term_checker.COUNTERS['lemma_cache_hits'] == 2
+
+    # A different key empties the cache
+    cache = term_checker.LemmaCache(path, key + 'x')
+    assert cache.get('devices') is None
+    cache.close()
+
+    # Only the most recently used terms are kept
+    cache = term_checker.LemmaCache(path, key, max_size=2)
+    cache.put('a', 'a')
+    cache.put('b', 'b')
+    cache.close()
+    cache = term_checker.LemmaCache(path, key, max_size=2)
+    cache.get('a')
+    cache.put('c', 'c')
+    cache.close()
+    cache = term_checker.LemmaCache(path, key)
+    assert cache.lemmas == {'a': 'a', 'c': 'c'}
+    cache.close()
+
+
+# Testing working out the lemma forms of many target terms at once
+def test_lemmatize(tmp_path):
+
+    path = str(tmp_path / 'glossary.txt.lemmas.sqlite')
+    terms = ['devices', 'printing devices', 'devices',
+             'cross-sectional views', 'exemplary embodiments']
+    glossary = term_checker.CompiledGlossary({'装置': ['devices']})
+    key = term_checker.lemma_cache_key(glossary, nlp)
+
+    # Each term is parsed once, in a single pass through the pipeline
+    term_checker.COUNTERS.clear()
+    glossary.lemma_cache = term_checker.LemmaCache(path, key)
+    glossary.lemma('devices', nlp)
+    glossary.lemmatize(terms, nlp, batch_size=2)
+    glossary.lemma_cache.close()
+    assert term_checker.COUNTERS['term_parses'] == len(set(terms))
+    assert glossary.lemma_forms == {term: term_checker.get_lemma(term, nlp)
+                                    for term in terms}
+
+    # And taken from the lemma cache by the next run
+    term_checker.COUNTERS.clear()
+    lemma_forms = glossary.lemma_forms
+    glossary = term_checker.CompiledGlossary(glossary.terminology)
+    glossary.lemma_cache = term_checker.LemmaCache(path, key)
+    glossary.lemmatize(terms, nlp)
+    glossary.lemma_cache.close()
+    assert glossary.lemma_forms == lemma_forms
+    assert term_checker.COUNTERS['term_parses'] == 0
+
+
+# Testing obtaining translation segments from a tmx file one at a time
+def test_iter_translation(tmp_path):
+
+    tmx = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<tmx version="1.4"><header srclang="ja-JP"/><body>\n'
+           '<tu><tuv xml:lang="ja-JP"><seg>[図1]...を示す断面模式図である。</seg></tuv>'
+           '<tuv xml:lang="en-US"><seg>Fig. 1 is a schematic view depicting ...</seg></tuv></tu>\n'
+           '<tu><tuv xml:lang="ja-JP"><seg>装置<ph>&lt;b&gt;</ph>10</seg></tuv>'
+           '<tuv xml:lang="en-US"><seg>device &amp; 10</seg></tuv></tu>\n'
+           '<tu><tuv xml:lang="ja-JP"><seg>要約書</seg></tuv></tu>\n'
+           '</body></tmx>\n')
+    translation_file = tmp_path / 'translation.tmx'
+    translation_file.write_text(tmx, encoding='utf-8')
+
+    expected = [('[図1]...を示す断面模式図である。',
+                 'Fig. 1 is a schematic view depicting ...'),
+                ('装置<b>10', 'device & 10'),
+                ('要約書', None)]
+
+    segments = term_checker.iter_translation(str(translation_file))
+    assert not isinstance(segments, list)
+
+    output = [(seg.source_text, seg.target_text, seg.position)
+              for seg in segments]
+    assert output == [texts + (position,)
+                      for position, texts in enumerate(expected)]
+
+
+# Testing that the source is taken from the tuv in the header's srclang
+def test_target_first_tuv(tmp_path):
+
+    tmx = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<tmx version="1.4"><header srclang="ja-JP"/><body>\n'
+           '<tu><tuv xml:lang="en-US"><seg>A printing device.</seg></tuv>'
+           '<tuv xml:lang="ja-JP"><seg>印刷装置</seg></tuv></tu>\n'
+           '<tu><tuv xml:lang="ja-jp"><seg>技術分野</seg></tuv>'
+           '<tuv xml:lang="en-US"><seg>Technical field</seg></tuv></tu>\n'
+           '<tu><tuv xml:lang="fr-FR"><seg>装置</seg></tuv>'
+           '<tuv xml:lang="en-US"><seg>A device</seg></tuv></tu>\n'
+           '</body></tmx>\n')
+    translation_file = str(tmp_path / 'translation.tmx')
+    with open(translation_file, 'w', encoding='utf-8') as f:
+        f.write(tmx)
+
+    # Document order is used when no tuv is in the source language
+    expected = [('印刷装置', 'A printing device.'),
+                ('技術分野', 'Technical field'),
+                ('装置', 'A device')]
+
+    def texts(translation):
+        return [(seg.source_text, seg.target_text) for seg in translation]
+
+    assert texts(term_checker.iter_translation(translation_file)) == expected
+    assert texts(term_checker.get_translation(translation_file))[:2] == \
+        expected[:2]
+
+    glossary = term_checker.CompiledGlossary({'印刷装置': ['printing device']})
+    assert texts(term_checker.iter_mapped_checks(translation_file,
+                                                 glossary)) == expected
+
+    # Shards keep the header, and so the source language
+    glossary_file = str(tmp_path / 'glossary.txt')
+    shutil.copy(GLOSSARY_FILE_1, glossary_file)
+    term_checker.split_translation(translation_file, glossary_file, 2)
+    manifest = term_checker.read_shard_manifest(translation_file +
+                                                '.shards.json')
+    assert [text for shard in manifest['shards']
+            for text in texts(term_checker.iter_translation(
+                str(tmp_path / shard['file'])))] == expected
+
+
+# Testing reading and checking a memory-mapped translation in ranges
+@pytest.mark.parametrize('workers', [1, 2])
+def test_mapped_checks(tmp_path, monkeypatch, workers):
+
+    tmx = ('\ufeff<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<tmx version="1.4"><header srclang="ja-JP"/><body>\n' +
+           ''.join('<tu tuid="{}"><tuv xml:lang="ja-JP"><seg>{}</seg></tuv>'
+                   '<tuv xml:lang="en-US"><seg>{}</seg></tuv></tu>\n'.format(
+                       index, *texts)
+                   for index, texts in enumerate(
+                       [('印刷装置', 'A printing device.'),
+                        ('印刷装置', 'A printing-device.'),
+                        ('技術分野', 'Technical field'),
+                        ('装置<ph>&lt;b&gt;</ph>', 'A device'),
+                        ('実施形態', 'An embodiment.')] * 3)) +
+           '<tu/>\n</body></tmx>\n')
+    translation_file = str(tmp_path / 'translation.tmx')
+    with open(translation_file, 'w', encoding='utf-8') as f:
+        f.write(tmx)
+
+    terminology = {'印刷装置': ['printing device'],
+                   '技術分野': ['Technical Field'],
+                   '装置': ['device'],
+                   '実施形態': ['exemplary embodiment']}
+    glossary = term_checker.CompiledGlossary(terminology)
+
+    with open(translation_file, 'rb') as f:
+        assert len(term_checker.tu_offsets(f.read())) == 16
+
+    def results(translation):
+        return [(seg.source_text, seg.target_text, seg.position,
+                 dict(seg.missing_terms), dict(seg.hyphenated_forms))
+                for seg in translation]
+
+    expected = results(term_checker.stream_basic_check(
+        glossary, term_checker.iter_translation(translation_file)))
+
+    # Ranges smaller than the translation, so that several are checked
+    monkeypatch.setattr(term_checker, 'TU_RANGE_SIZE', 4)
+    assert results(term_checker.iter_mapped_checks(
+        translation_file, glossary, workers)) == expected
+    assert results(term_checker.iter_mapped_checks(
+        translation_file, glossary, workers, keep_all=False)) == \
+        [result for result in expected if result[3]]
+
+    # Repetitions checked with the ranges are given the earlier results,
+    # and all repetitions are counted, including those of clean segments
+    options = {'mmap': True, 'workers': workers}
+    term_checker.COUNTERS.clear()
+    output = results(term_checker.stream_checks(glossary, translation_file,
+                                                options, lambda: nlp))
+    repeated_num = term_checker.COUNTERS['repeated_segments']
+    term_checker.COUNTERS.clear()
+    assert output == results(term_checker.stream_checks(
+        glossary, translation_file, {}, lambda: nlp))
+    assert repeated_num == term_checker.COUNTERS['repeated_segments'] == 10
+    assert [result[2] for result in output] == [1, 4, 6, 9, 11, 14]
+
+
 # Testing the basic check of the glossary against the translation
 def test_basic_check():
 
@@ -267,6 +642,367 @@ def test_basic_check():
     assert output == expected
 
 
+# Testing checking repeated segments once and reusing their results
+def test_repeats(tmp_path, monkeypatch):
+
+    terminology = {'印刷装置': ['printing device'],
+                   '実施形態': ['exemplary embodiment']}
+
+    translation = [Segment('印刷装置', 'A printing-device.'),
+                   Segment('実施形態', 'An exemplary embodiment.'),
+                   Segment('印刷装置', 'A  printing-device. '),
+                   Segment('印刷装置', 'A printing device.'),
+                   Segment('実施形態', 'An exemplary embodiment.')]
+
+    term_checker.COUNTERS.clear()
+    translation = term_checker.find_repeats(translation)
+    translation = term_checker.stream_basic_check(terminology, translation)
+    translation = term_checker.stream_hyphen_check(terminology, translation)
+    translation = list(term_checker.copy_repeats(translation))
+
+    assert term_checker.COUNTERS['repeated_segments'] == 2
+    assert translation[2].repeat_of is translation[0]
+    assert translation[4].repeat_of is translation[1]
+    assert [(seg.missing_terms, seg.hyphenated_forms)
+            for seg in translation] == \
+        [({'印刷装置': ['printing device']}, {'印刷装置': 'printing-device'}),
+         ({}, {}),
+         ({'印刷装置': ['printing device']}, {'印刷装置': 'printing-device'}),
+         ({}, {}),
+         ({}, {})]
+
+    # Once checked, only first segments with missing terms are kept
+    segments = [Segment('印刷装置', 'A printing device.'),
+                Segment('実施形態', 'An embodiment.'),
+                Segment('印刷装置', 'A printing device.'),
+                Segment('実施形態', 'An  embodiment.')]
+    repeats = term_checker.Repeats()
+    translation = repeats.mark(segments)
+    translation = term_checker.stream_basic_check(terminology, translation)
+    translation = repeats.forget_clean(translation)
+    translation = [segment for segment in translation
+                   if term_checker.needs_checking(segment)]
+
+    assert translation == [segments[1], segments[3]]
+    assert segments[2].repeat_of is term_checker.CLEAN_SEGMENT
+    assert segments[3].repeat_of is segments[1]
+    assert list(repeats.first_segments.values()) == \
+        [term_checker.CLEAN_SEGMENT, segments[1]]
+    assert all(len(digest) == 20 for digest in repeats.first_segments)
+
+    # Including those whose missing terms are found by the lemma check
+    translation_file = tmp_path / 'translation.tmx'
+    translation_file.write_text(
+        '<tmx version="1.4"><header srclang="ja-JP"/><body>' +
+        '<tu><tuv xml:lang="ja-JP"><seg>印刷装置</seg></tuv>'
+        '<tuv xml:lang="en-US"><seg>The printing device.</seg></tuv>'
+        '</tu>' * 2 + '</body></tmx>', encoding='utf-8')
+    instances = []
+
+    class RecordedRepeats(term_checker.Repeats):
+        def __init__(self):
+            super().__init__()
+            instances.append(self)
+
+    monkeypatch.setattr(term_checker, 'Repeats', RecordedRepeats)
+    term_checker.COUNTERS.clear()
+    glossary = term_checker.CompiledGlossary({'印刷装置': ['printing devices']})
+    assert not any(segment.findings()
+                   for segment in term_checker.stream_checks(
+                       glossary, str(translation_file), {}, lambda: nlp))
+    assert term_checker.COUNTERS['segments_needing_nlp'] == 1
+    assert list(instances[0].first_segments.values()) == \
+        [term_checker.CLEAN_SEGMENT]
+
+
+# Testing that stored results are keyed on the spaCy and model versions
+def test_fingerprint_store_key(monkeypatch):
+    import importlib.metadata
+
+    versions = {'spacy': '3.7.2', 'en_core_web_sm': '3.7.1'}
+    monkeypatch.setattr(importlib.metadata, 'version',
+                        lambda package: versions[package])
+    key = term_checker.fingerprint_store_key({})
+    assert 'spacy-3.7.2' in key and 'en_core_web_sm-3.7.1' in key
+
+    versions['en_core_web_sm'] = '3.8.0'
+    assert term_checker.fingerprint_store_key({}) != key
+    assert term_checker.fingerprint_store_key({'pipeline': 'lemma'}) != \
+        term_checker.fingerprint_store_key({})
+
+
+# Testing reusing the results of unchanged segments between runs
+def test_fingerprint_store(tmp_path):
+
+    path = str(tmp_path / 'translation.tmx.termcheck.json')
+
+    def run(terminology):
+        glossary = term_checker.CompiledGlossary(terminology)
+        store = term_checker.FingerprintStore(path, glossary, 'key')
+        translation = [Segment('印刷装置', 'A printing-device.'),
+                       Segment('実施形態', 'An embodiment.'),
+                       Segment('印刷装置', 'A printing-device.')]
+        term_checker.COUNTERS.clear()
+        translation = term_checker.find_repeats(translation)
+        translation = store.reuse(translation)
+        translation = term_checker.stream_basic_check(glossary, translation)
+        translation = term_checker.stream_hyphen_check(glossary, translation)
+        translation = store.record(translation)
+        translation = store.update(translation)
+        translation = list(term_checker.copy_repeats(translation))
+        store.save()
+        return [(seg.missing_terms, seg.hyphenated_forms)
+                for seg in translation]
+
+    terminology = {'印刷装置': ['printing device'],
+                   '実施形態': ['exemplary embodiment']}
+    first_results = run(terminology)
+    assert term_checker.COUNTERS['reused_segments'] == 0
+
+    # Unchanged translation and glossary, so every segment is reused
+    assert run(terminology) == first_results
+    assert term_checker.COUNTERS['reused_segments'] == 2
+
+    # Only the segment containing the changed entry is checked again
+    terminology['実施形態'] = ['embodiment']
+    results = run(terminology)
+    assert term_checker.COUNTERS['reused_segments'] == 1
+    assert results == [first_results[0], ({}, {}), first_results[2]]
+
+
+# Testing that spaCy is not imported when nothing is found missing
+def test_fast_path_imports(tmp_path):
+
+    glossary_file = tmp_path / 'glossary.txt'
+    glossary_file.write_text('印刷装置\tprinting device\n', encoding='utf-8')
+    translation_file = tmp_path / 'translation.tmx'
+    translation_file.write_text(
+        '<tmx version="1.4"><body><tu>'
+        '<tuv xml:lang="ja-JP"><seg>印刷装置</seg></tuv>'
+        '<tuv xml:lang="en-US"><seg>A printing device.</seg></tuv>'
+        '</tu></body></tmx>', encoding='utf-8')
+
+    script = ('import sys, term_checker\n'
+              'sys.argv = ["term_checker.py", sys.argv[1], sys.argv[2]]\n'
+              'term_checker.main()\n'
+              'print(sorted(name for name in ["spacy", "numpy", "translate"]\n'
+              '             if name in sys.modules))\n')
+    result = subprocess.run([sys.executable, '-c', script,
+                             str(translation_file), str(glossary_file)],
+                            cwd=os.path.dirname(term_checker.__file__),
+                            capture_output=True, text=True, check=True)
+
+    assert 'No terminology errors found.' in result.stdout
+    assert result.stdout.rstrip().endswith('[]')
+
+
+# Testing that each source text is scanned once, however many stages use
+# the source terms found in it
+@pytest.mark.parametrize('mmap', [False, True])
+def test_single_source_scan(tmp_path, mmap):
+
+    translation_file = tmp_path / 'translation.tmx'
+    translation_file.write_text(
+        '<tmx version="1.4"><body>' +
+        ''.join('<tu><tuv xml:lang="ja-JP"><seg>{}</seg></tuv>'
+                '<tuv xml:lang="en-US"><seg>{}</seg></tuv></tu>'.format(
+                    source_text, target_text)
+                for source_text, target_text in
+                [('印刷装置', 'A printing device.'),
+                 ('要約書', 'Summary'),
+                 ('印刷装置', 'A printing device.')]) +
+        '</body></tmx>', encoding='utf-8')
+    glossary = term_checker.CompiledGlossary({'印刷装置': ['printing device'],
+                                              '要約書': ['Abstract']})
+    matrix = term_checker.OccurrenceMatrix(glossary)
+
+    scanned = []
+    scan = glossary.scanner.scan
+
+    def counted_scan(text):
+        scanned.append(text)
+        return scan(text)
+
+    glossary.scanner.scan = counted_scan
+    options = {'incremental': True, 'mmap': mmap}
+    for _ in term_checker.stream_checks(glossary, str(translation_file),
+                                        options, lambda: nlp, matrix):
+        pass
+
+    # The repetition is scanned once too, by the matrix (or, with --mmap,
+    # by the basic check before it is found to be a repetition)
+    assert sorted(scanned) == ['印刷装置', '印刷装置', '要約書']
+    assert matrix.term_stats() == [('印刷装置', 2, 2), ('要約書', 1, 0)]
+
+    # The terms kept are only used with the glossary they were found with
+    segment = Segment('印刷装置の要約書', 'A printing device.')
+    term_checker.basic_check({'印刷装置': ['printing device']}, [segment])
+    translation, missing = term_checker.basic_check({'要約書': ['Abstract']},
+                                                    [segment])
+    assert missing
+    assert segment.missing_terms == {'要約書': ['Abstract']}
+
+
+# Testing writing results to the terminal, JSON Lines and CSV reporters
+def test_reporters(tmp_path):
+
+    translation = [Segment('装置', 'The device.'),
+                   Segment('印刷装置', 'A printing-device.',
+                           {'印刷装置': ['printing device', 'printer', 'press']},
+                           {'印刷装置': 'printing-device'}, position=1)]
+
+    terminal = io.StringIO()
+    reporters = [term_checker.TerminalReporter(terminal),
+                 term_checker.JsonlReporter(str(tmp_path / 'results.jsonl')),
+                 term_checker.CsvReporter(str(tmp_path / 'results.csv'))]
+    term_checker.output_results(translation, reporters, 'translation.tmx')
+    term_checker.output_results(translation[:1], reporters, 'clean.tmx')
+    term_checker.close_reporters(reporters)
+
+    assert terminal.getvalue() == (
+        Fore.RED + '\n\'印刷装置\' should be translated as '
+        '\'printing device\', \'printer\', or \'press\' ' +
+        Fore.RED + '(although \'printing-device\' appears in the target '
+        'text) ' + Fore.CYAN + '\nSource text:\n' + Fore.RESET + '印刷装置\n' +
+        Fore.CYAN + 'Target text:\n' + Fore.RESET + 'A printing-device.\n' +
+        Fore.CYAN + '\nNo terminology errors found.\n\n')
+
+    with open(tmp_path / 'results.jsonl', encoding='utf-8') as file:
+        assert [json.loads(line) for line in file] == [
+            {'translation': 'translation.tmx', 'segment': 1,
+             'source_text': '印刷装置',
+             'target_text': 'A printing-device.',
+             'findings': [{'source_term': '印刷装置',
+                           'target_terms': ['printing device', 'printer',
+                                            'press'],
+                           'hyphenated_form': 'printing-device'}]}]
+
+    with open(tmp_path / 'results.csv', encoding='utf-8', newline='') as file:
+        assert list(csv.reader(file)) == [
+            ['translation', 'segment', 'source_term', 'target_terms',
+             'hyphenated_form', 'source_text', 'target_text'],
+            ['translation.tmx', '1', '印刷装置',
+             'printing device | printer | press', 'printing-device',
+             '印刷装置', 'A printing-device.']]
+
+
+# Testing splitting a translation into shards checked by separate processes
+def test_shards(tmp_path):
+
+    translation_file = str(tmp_path / 'translation.tmx')
+    glossary_file = str(tmp_path / 'glossary.txt')
+    shutil.copy(TRANSLATION_FILE_1, translation_file)
+    shutil.copy(GLOSSARY_FILE_1, glossary_file)
+
+    term_checker.split_translation(translation_file, glossary_file, 2)
+    manifest_file = translation_file + '.shards.json'
+    manifest = term_checker.read_shard_manifest(manifest_file)
+    segment_nums = [shard['segment_num'] for shard in manifest['shards']]
+    assert sum(segment_nums) == \
+        len(list(term_checker.iter_translation(translation_file)))
+    assert max(segment_nums) - min(segment_nums) <= 1
+
+    # Each shard is checked in a process of its own
+    processes = [subprocess.Popen([sys.executable, 'term_checker.py',
+                                   '--shard=' + str(shard), manifest_file],
+                                  cwd=os.path.dirname(term_checker.__file__),
+                                  stdout=subprocess.DEVNULL)
+                 for shard in [2, 1]]
+    assert [process.wait() for process in processes] == [0, 0]
+
+    glossary = term_checker.prepare_glossary(glossary_file)
+    expected = [(seg.position, seg.source_text, seg.target_text,
+                 seg.findings())
+                for seg in term_checker.stream_checks(glossary,
+                                                      translation_file, {},
+                                                      lambda: nlp)
+                if seg.findings()]
+    merged = [(seg.position, seg.source_text, seg.target_text,
+               seg.findings())
+              for seg in term_checker.iter_shard_results(manifest)]
+    assert expected
+    assert merged == expected
+
+
+# Testing that --split is handled before --daemon, and that no shards are
+# split or checked for a number of 0, nor translations with fewer than one
+# worker or segment per batch
+def test_split_main(tmp_path, monkeypatch, capsys):
+
+    translation_file = str(tmp_path / 'translation.tmx')
+    manifest_file = translation_file + '.shards.json'
+    shutil.copy(TRANSLATION_FILE_1, translation_file)
+
+    def main(*arguments):
+        monkeypatch.setattr(sys, 'argv', ['term_checker.py'] + list(arguments))
+        term_checker.main()
+        return capsys.readouterr().out
+
+    assert 'at least 1' in main(translation_file, GLOSSARY_FILE_1, '--split=0')
+    assert not os.path.exists(manifest_file)
+    for option in ['--workers=0', '--workers=-2', '--batch-size=0']:
+        assert 'at least 1' in main(translation_file, GLOSSARY_FILE_1, option,
+                                    '--mmap')
+
+    server = term_checker.make_daemon({'lemma_cache': 'off'}, 0)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        main(translation_file, GLOSSARY_FILE_1, '--split=2', '--daemon',
+             '--port=' + str(port))
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        term_checker.BATCH.clear()
+    manifest = term_checker.read_shard_manifest(manifest_file)
+    assert len(manifest['shards']) == 2
+
+    assert 'from 1 to 2' in main('--shard=0', manifest_file)
+    assert not any(os.path.exists(str(tmp_path / shard['results']))
+                   for shard in manifest['shards'])
+
+
+# Testing splitting translations with namespaced attributes, with no
+# translation units, and missing translations
+def test_split_translation_files(tmp_path, capsys):
+
+    translation_file = str(tmp_path / 'translation.tmx')
+    with open(translation_file, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<tmx version="1.4" '
+                'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                'xsi:noNamespaceSchemaLocation="tmx14.xsd" xml:lang="en">'
+                '<header srclang="ja-JP"/><body>\n' +
+                '<tu><tuv xml:lang="ja-JP"><seg>装置</seg></tuv>'
+                '<tuv xml:lang="en-US"><seg>A device</seg></tuv></tu>\n' * 3 +
+                '</body></tmx>\n')
+
+    term_checker.split_translation(translation_file, GLOSSARY_FILE_1, 2)
+    manifest = term_checker.read_shard_manifest(translation_file +
+                                                '.shards.json')
+    for shard in manifest['shards']:
+        shard_file = str(tmp_path / shard['file'])
+        assert len(list(term_checker.iter_translation(shard_file))) == \
+            shard['segment_num']
+        with open(shard_file, encoding='utf-8') as f:
+            assert 'xsi:noNamespaceSchemaLocation="tmx14.xsd"' in f.read()
+
+    # Nothing is split when there are no translation units
+    empty_file = str(tmp_path / 'empty.tmx')
+    with open(empty_file, 'w', encoding='utf-8') as f:
+        f.write('<tmx version="1.4"><header/><body></body></tmx>')
+    capsys.readouterr()
+    term_checker.split_translation(empty_file, GLOSSARY_FILE_1, 2)
+    assert 'no segments' in capsys.readouterr().out
+    assert not os.path.exists(empty_file + '.shards.json')
+
+    with pytest.raises(SystemExit):
+        term_checker.split_translation(str(tmp_path / 'missing.tmx'),
+                                       GLOSSARY_FILE_1, 2)
+
+
 # Testing obtaining the lemma form of a term
 @pytest.mark.parametrize('user_input,expected', [
                           ('device', 'device'),
@@ -280,6 +1016,17 @@ def test_get_lemma(user_input, expected):
     assert term_checker.get_lemma(user_input, nlp) == expected
 
 
+# Testing that the lean pipeline profile gives the same lemmas
+def test_setup_tokenizer_lemma_profile():
+    lean_nlp = term_checker.setup_tokenizer('lemma')
+    assert 'parser' not in lean_nlp.pipe_names
+    assert 'ner' not in lean_nlp.pipe_names
+    for term in ['devices', 'printing devices', 'cross-sectional views',
+                 'transmitting', 'exemplary embodiments']:
+        assert term_checker.get_lemma(term, lean_nlp) == \
+            term_checker.get_lemma(term, nlp)
+
+
 # Testing searching target text for the lemma form of a term
 def test_target_search():
     # Test 1 - positive
@@ -334,6 +1081,18 @@ def test_target_search():
     assert not found
 
 
+# Testing matching several term lemmas against a doc at once
+def test_match_lemmas():
+    doc = nlp('Devices are connected to the information processing devices 10 via the unit.')
+    term_lemmas = ['device', 'information processing device',
+                   'processing device', 'unit device', 'connect', 'via unit',
+                   'the unit']
+    expected = {'device', 'information processing device',
+                'processing device', 'connect', 'the unit'}
+    assert term_checker.match_lemmas(doc, term_lemmas) == expected
+    assert term_checker.match_lemmas(nlp(''), term_lemmas) == set()
+
+
 # Testing the lemma-based check of the glossary against the translation
 def test_lemma_check():
 
@@ -376,6 +1135,315 @@ def test_lemma_check():
     assert output == expected
 
 
+# Testing that each target text is parsed at most once by the lemma check
+def test_lemma_check_parses_once():
+
+    terminology = {'装置': ['device', 'apparatus', 'unit'],
+                   '印刷装置': ['printing device', 'printer'],
+                   '実施形態': ['exemplary embodiment']}
+
+    translation = [Segment('印刷装置と装置', 'The printing devices and units.',
+                           {'装置': ['device', 'apparatus', 'unit'],
+                            '印刷装置': ['printing device', 'printer']}, {}),
+                   Segment('装置', 'The device.', {}, {}),
+                   Segment('実施形態', 'Another embodiment.',
+                           {'実施形態': ['exemplary embodiment']}, {})]
+
+    term_checker.COUNTERS.clear()
+    translation = term_checker.lemma_check(nlp, terminology, translation)
+
+    assert term_checker.COUNTERS['segments_needing_nlp'] == 2
+    assert term_checker.COUNTERS['target_parses'] == 2
+    assert [seg.missing_terms for seg in translation] == \
+        [{}, {}, {'実施形態': ['exemplary embodiment']}]
+
+
+# Testing that batched and multi-process lemmatization give the same results
+@pytest.mark.parametrize('batch_size,n_process', [(1, 1), (2, 1), (2, 2)])
+def test_lemma_check_batched(batch_size, n_process):
+
+    terminology = {'装置': ['device'],
+                   '送信': ['transmit'],
+                   '実施形態': ['exemplary embodiment']}
+
+    translation = [Segment('装置', 'The devices.', {'装置': ['device']}, {}),
+                   Segment('送信', 'Not transmitting.', {'送信': ['transmit']}, {}),
+                   Segment('装置', 'A device.', {}, {}),
+                   Segment('実施形態', 'An embodiment.',
+                           {'実施形態': ['exemplary embodiment']}, {}),
+                   Segment('送信', 'Transmittance.', {'送信': ['transmit']}, {})]
+
+    translation = term_checker.lemma_check(nlp, terminology, translation,
+                                           batch_size, n_process)
+
+    assert [seg.missing_terms for seg in translation] == \
+        [{}, {}, {}, {'実施形態': ['exemplary embodiment']},
+         {'送信': ['transmit']}]
+
+
+# Testing listing the translation/glossary pairs of a batch run
+def test_batch_jobs(tmp_path):
+
+    (tmp_path / 'sub').mkdir()
+    for name in ['a.tmx', 'sub/b.tmx', 'sub/notes.txt', 'glossary.txt']:
+        (tmp_path / name).write_text('')
+    manifest = tmp_path / 'manifest.txt'
+    manifest.write_text('# translation\tglossary\n\nsub/b.tmx\tglossary.txt\n')
+
+    assert term_checker.batch_jobs(
+        ['term_checker.py', str(tmp_path), str(tmp_path / 'glossary.txt')]) == \
+        [(str(tmp_path / 'a.tmx'), str(tmp_path / 'glossary.txt')),
+         (str(tmp_path / 'sub' / 'b.tmx'), str(tmp_path / 'glossary.txt'))]
+    assert term_checker.batch_jobs(['term_checker.py'], str(manifest)) == \
+        [(str(tmp_path / 'sub' / 'b.tmx'), str(tmp_path / 'glossary.txt'))]
+
+    manifest.write_text('sub/b.tmx glossary.txt\n')
+    assert term_checker.batch_jobs(['term_checker.py'], str(manifest)) is None
+    assert term_checker.batch_jobs(['term_checker.py', str(tmp_path)]) is None
+    assert term_checker.batch_jobs(
+        ['term_checker.py', str(tmp_path / 'c.tmx'), 'glossary.txt']) is None
+
+
+# Testing that batch jobs give the same results as checking each translation
+def test_check_job():
+
+    options = {'lemma_cache': 'off'}
+    term_checker.prepare_batch([GLOSSARY_FILE_1], options)
+
+    for translation_file in [TRANSLATION_FILE_1, TRANSLATION_FILE_2]:
+        job = (translation_file, GLOSSARY_FILE_1)
+        glossary = term_checker.prepare_glossary(GLOSSARY_FILE_1)
+        expected = [(seg.source_text, seg.target_text,
+                     dict(seg.missing_terms), dict(seg.hyphenated_forms),
+                     seg.position)
+                    for seg in term_checker.stream_checks(
+                        glossary, translation_file, options, lambda: nlp)
+                    if seg.findings()]
+
+        assert expected
+        assert term_checker.check_job(job)[:2] == (job, expected)
+
+    term_checker.BATCH.clear()
+
+
+# Testing checking a translation through a daemon on a local port
+def test_daemon(tmp_path, monkeypatch):
+
+    server = term_checker.make_daemon({'lemma_cache': 'off'}, 0)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    try:
+        results, counters = term_checker.request_check(TRANSLATION_FILE_1,
+                                                       GLOSSARY_FILE_1, port)
+        job = (os.path.abspath(TRANSLATION_FILE_1),
+               os.path.abspath(GLOSSARY_FILE_1))
+        expected = term_checker.check_job(job)
+        assert [tuple(result) for result in results] == expected[1]
+        assert counters == expected[2]
+        assert term_checker.request_check('missing.tmx', GLOSSARY_FILE_1,
+                                          port) is None
+
+        # The results are written to the files given with the options
+        jsonl_file = str(tmp_path / 'results.jsonl')
+        assert term_checker.daemon_main(
+            ['term_checker.py', TRANSLATION_FILE_1, GLOSSARY_FILE_1],
+            {'port': port, 'jsonl': jsonl_file})
+        with open(jsonl_file, encoding='utf-8') as f:
+            assert [json.loads(line)['segment'] for line in f] == \
+                [result[4] for result in expected[1]]
+
+        # Options the daemon does not honour are checked in this process
+        translation_file = str(tmp_path / 'translation.tmx')
+        glossary_file = str(tmp_path / 'glossary.txt')
+        shutil.copy(TRANSLATION_FILE_1, translation_file)
+        shutil.copy(GLOSSARY_FILE_1, glossary_file)
+        monkeypatch.setattr(sys, 'argv', [
+            'term_checker.py', translation_file, glossary_file, '--daemon',
+            '--port=' + str(port), '--incremental'])
+        term_checker.main()
+        assert os.path.exists(translation_file + '.termcheck.json')
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        term_checker.BATCH.clear()
+
+    # No daemon is running any more
+    assert term_checker.request_check(TRANSLATION_FILE_1, GLOSSARY_FILE_1,
+                                      port) is None
+
+
+# Testing checking one segment at a time
+def test_term_checker():
+
+    terminology = {'実施形態': ['embodiments'],
+                   '印刷装置': ['printing device'],
+                   '送信': ['transmit']}
+    checker = term_checker.TermChecker(terminology, nlp, cache_size=2)
+
+    term_checker.COUNTERS.clear()
+    assert checker.check_segment('実施形態', 'An embodiment.') == ()
+    assert checker.check_segment('送信', 'Not sent.') == \
+        (term_checker.Finding('送信', ['transmit']),)
+    assert checker.check_segment('印刷装置', 'A printing-device.') == \
+        (term_checker.Finding('印刷装置', ['printing device'],
+                              'printing-device'),)
+    assert checker.check_segment('', 'No source text.') == ()
+    assert term_checker.COUNTERS['target_parses'] == 3
+
+    # Only the 2 most recently checked segments are kept
+    assert checker.check_segment('印刷装置', ' A printing-device. ') == \
+        (term_checker.Finding('印刷装置', ['printing device'],
+                              'printing-device'),)
+    assert checker.check_segment('実施形態', 'An embodiment.') == ()
+    assert term_checker.COUNTERS['checker_cache_hits'] == 1
+    assert term_checker.COUNTERS['target_parses'] == 4
+
+
+# Testing measuring nested stages with the profiler
+def test_profiler():
+
+    def slow_items():
+        for item in range(3):
+            time.sleep(0.02)
+            yield item
+
+    profiler = term_checker.Profiler()
+    assert profiler.stage('inner', [1, 2]) == [1, 2]
+
+    profiler.enable()
+    try:
+        inner = profiler.stage('inner', slow_items())
+        outer = profiler.stage('outer', (item * 2 for item in inner))
+        assert profiler.call('sum', sum, outer) == 6
+        report = profiler.report()
+    finally:
+        tracemalloc.stop()
+
+    stages = report['stages']
+    assert [stages[name]['items'] for name in ['inner', 'outer', 'sum']] == \
+        [3, 3, 0]
+    assert stages['inner']['wall'] >= 0.06
+    assert stages['outer']['wall'] < 0.02
+    assert stages['sum']['wall'] < 0.02
+    assert report['wall'] >= 0.06
+
+
+# Testing that a run with --profile writes its profile
+@pytest.mark.parametrize('option', [None, '--index', '--mmap'])
+def test_profile_main(tmp_path, option):
+
+    glossary_file = tmp_path / 'glossary.txt'
+    glossary_file.write_text('印刷装置\tprinting device\n', encoding='utf-8')
+    translation_file = tmp_path / 'translation.tmx'
+    translation_file.write_text(
+        '<tmx version="1.4"><body><tu>'
+        '<tuv xml:lang="ja-JP"><seg>印刷装置</seg></tuv>'
+        '<tuv xml:lang="en-US"><seg>A printer.</seg></tuv>'
+        '</tu><tu>'
+        '<tuv xml:lang="ja-JP"><seg>要約書</seg></tuv>'
+        '<tuv xml:lang="en-US"><seg>Abstract</seg></tuv>'
+        '</tu></body></tmx>', encoding='utf-8')
+    profile_file = tmp_path / 'profile.json'
+
+    arguments = [str(translation_file), str(glossary_file),
+                 '--profile=' + str(profile_file)]
+    if option:
+        arguments.append(option)
+    script = ('import sys, term_checker\n'
+              'sys.argv = ["term_checker.py"] + sys.argv[1:]\n'
+              'term_checker.main()\n')
+    result = subprocess.run([sys.executable, '-c', script] + arguments,
+                            cwd=os.path.dirname(term_checker.__file__),
+                            capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert 'Profile written to' in result.stdout
+    with open(profile_file, encoding='utf-8') as f:
+        profile = json.load(f)
+    assert profile['segments'] == 2
+    assert 'prepare_glossary' in profile['stages']
+
+
+# Testing recording term occurrences and coverage statistics
+def test_occurrence_matrix():
+
+    terminology = {'装置': ['devices'],
+                   '印刷': ['printing'],
+                   '要約書': ['abstract']}
+    glossary = term_checker.CompiledGlossary(terminology)
+    matrix = term_checker.OccurrenceMatrix(glossary)
+
+    translation = [Segment('印刷装置', 'A printing device.'),
+                   Segment('装置', 'Devices.'),
+                   Segment('', ''),
+                   Segment('印刷', 'Typed.'),
+                   Segment('印刷装置', 'A printing device.')]
+
+    translation = term_checker.find_repeats(translation)
+    translation = term_checker.stream_basic_check(glossary, translation)
+    translation = term_checker.stream_hyphen_check(glossary, translation)
+    translation = matrix.record(translation)
+    translation = (segment for segment in translation
+                   if term_checker.needs_checking(segment))
+    translation = term_checker.stream_lemma_check(nlp, glossary, translation)
+    translation = term_checker.copy_repeats(translation)
+    list(matrix.resolve(translation))
+
+    assert matrix.segment_num == 5
+    assert not matrix.pending
+    assert matrix.term_stats() == [('装置', 3, 3), ('印刷', 3, 2),
+                                   ('要約書', 0, 0)]
+    assert matrix.segments('印刷') == [0, 3, 4]
+    assert matrix.segments('印刷', translated=False) == [3]
+
+
+# Testing looking up term lemmas in an index of the whole translation
+def test_lemma_index():
+
+    index = term_checker.LemmaIndex()
+    texts = ['The information processing devices 10B receive the request.',
+             'Devices are connected to the processing unit.',
+             'The device is not usually transmitting at this time.']
+    for segment_id, text in enumerate(texts):
+        index.add(segment_id, nlp(text))
+
+    assert index.find('device') == {0, 1, 2}
+    assert index.find('device', [1, 2]) == {1, 2}
+    assert index.find('information processing device') == {0}
+    assert index.find('processing device') == {0}
+    assert index.find('processing unit') == {1}
+    assert index.find('unit device') == set()
+    assert index.find('transmit') == {2}
+    assert index.find('apparatus') == set()
+
+
+# Testing that the index-based check gives the same results as lemma_check
+def test_index_check():
+
+    terminology = {'装置': ['device'],
+                   '送信': ['transmit'],
+                   '実施形態': ['exemplary embodiment']}
+
+    def make_translation():
+        return [Segment('装置', 'The devices.', {'装置': ['device']}, {}),
+                Segment('送信', 'Not transmitting.', {'送信': ['transmit']}, {}),
+                Segment('装置', 'A device.'),
+                Segment('実施形態', 'An embodiment.',
+                        {'実施形態': ['exemplary embodiment']}, {}),
+                Segment('送信', 'Transmittance.', {'送信': ['transmit']}, {})]
+
+    expected = term_checker.lemma_check(nlp, terminology, make_translation())
+    translation, index = term_checker.index_check(nlp, terminology,
+                                                  make_translation())
+
+    assert [seg.missing_terms for seg in translation] == \
+        [seg.missing_terms for seg in expected]
+    assert index.find('device') == {0, 2}
+
+
 # Testing searching for the hyphenated form of a term
 def test_check_hyphenated():
 
@@ -423,3 +1491,37 @@ def test_check_hyphenated():
                        seg.missing_terms, seg.hyphenated_forms))
                        
     assert output == expected
+
+
+# Testing finding variants of target terms in a normalized target text
+def test_term_variants():
+
+    terminology = {'印刷装置': ['printing device'],
+                   '断面': ['cross-section'],
+                   '技術分野': ['Technical Field'],
+                   '実施形態': ['exemplary embodiment']}
+
+    assert term_checker.normalize_text(
+        'A\u00a0Printing\tdevice, cross\u2013sec-\n  tion, soft\u00adware') == \
+        'a printing device, cross-section, software'
+
+    texts = [('印刷装置', 'A printing\u2013device.', 'printing-device'),
+             ('印刷装置', 'A PRINTING-\nDEVICE.', 'printing-device'),
+             ('印刷装置', 'A PRINTINGDEVICE.', 'printingdevice'),
+             ('断面', 'A cross section.', 'cross section'),
+             ('断面', 'A cross-\nsection.', None),
+             ('技術分野', 'Technical\u00a0Field', None),
+             ('実施形態', 'An exemplary\nembodiment.', None),
+             ('実施形態', 'An Exemplary-Embodiment.', 'exemplary-embodiment')]
+
+    translation = [term_checker.Segment(source, target)
+                   for source, target, _ in texts]
+    translation, missing = term_checker.basic_check(terminology, translation)
+
+    assert missing
+    assert [seg.hyphenated_forms.get(seg.source_text)
+            for seg in translation if seg.missing_terms] == \
+        [variant for _, _, variant in texts if variant]
+    assert [bool(seg.missing_terms) for seg in translation] == \
+        [variant is not None for _, _, variant in texts]
+    assert term_checker.hyphen_check(terminology, translation) == translation